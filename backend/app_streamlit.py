@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import requests
-import base64
+import time
 
 API_URL = "http://127.0.0.1:8001"
 
@@ -19,12 +20,18 @@ if "report_summary" not in st.session_state:
     st.session_state["report_summary"] = ""
 if "report_pdf" not in st.session_state:
     st.session_state["report_pdf"] = None
+if "rollup" not in st.session_state:
+    st.session_state["rollup"] = None
+if "scan_id" not in st.session_state:
+    st.session_state["scan_id"] = None
 
 # Clear button
 if st.sidebar.button("🧹 Clear/Reset App"):
     st.session_state["data"] = None
     st.session_state["report_summary"] = ""
     st.session_state["report_pdf"] = None
+    st.session_state["rollup"] = None
+    st.session_state["scan_id"] = None
     st.rerun()
 
 if "data" not in st.session_state:
@@ -32,18 +39,48 @@ if "data" not in st.session_state:
 
 st.sidebar.header("Audit Controls")
 
+
+def wait_for_job(job, label="Scan", poll_interval=1.0):
+    """Polls a submitted job with a progress bar. True once it is done."""
+    if "error" in job:
+        st.error(f"Error: {job['error']}")
+        return False
+
+    bar = st.progress(0.0, text="Queued...")
+    while True:
+        status = requests.get(f"{API_URL}/jobs/{job['job_id']}").json()
+        bar.progress(status["progress"], text=f"{status['stage'].title()}...")
+        if status["status"] == "done":
+            return True
+        if status["status"] in ("failed", "cancelled"):
+            st.error(f"{label} {status['status']}: {status.get('error') or ''}")
+            return False
+        time.sleep(poll_interval)
+
+
+def run_scan_job(params, files=None):
+    """Submits a background scan, waits for it and returns (DataFrame, rollup, scan_id), or None."""
+    job = requests.post(f"{API_URL}/jobs/scan", params=params, files=files).json()
+    if not wait_for_job(job):
+        return None
+
+    # Arrow IPC body: loaded straight into columns, no per-row JSON parsing
+    result = requests.get(f"{API_URL}/jobs/{job['job_id']}/result", params={"format": "arrow"})
+    rollup = requests.get(f"{API_URL}/jobs/{job['job_id']}/rollup").json()
+    df = pa.ipc.open_stream(result.content).read_all().to_pandas()
+    return df, rollup, result.headers.get("X-Scan-Id")
+
+
 # Mode 1: Synthetic
 if st.sidebar.button("🚀 Generate & Scan Synthetic Ledger"):
     with st.spinner("Running Ensemble Model (Stats + ML)..."):
         try:
-            res = requests.get(f"{API_URL}/scan?use_fake=true&use_llm=true")
-            if res.status_code == 200:
-                st.session_state["data"] = pd.DataFrame(res.json())
+            scan = run_scan_job({"use_fake": "true", "use_llm": "true"})
+            if scan is not None:
+                st.session_state["data"], st.session_state["rollup"], st.session_state["scan_id"] = scan
                 st.session_state["report_summary"] = ""
                 st.session_state["report_pdf"] = None
                 st.success("Analysis Complete")
-            else:
-                st.error(f"Error: {res.text}")
         except Exception as e:
             st.error(f"Connection Failed: {e}")
 
@@ -54,9 +91,9 @@ if uploaded:
         with st.spinner("Running Ensemble Model..."):
             files = {"file": uploaded}
             try:
-                res = requests.post(f"{API_URL}/scan?use_llm=true", files=files)
-                if res.status_code == 200:
-                    st.session_state["data"] = pd.DataFrame(res.json())
+                scan = run_scan_job({"use_llm": "true"}, files=files)
+                if scan is not None:
+                    st.session_state["data"], st.session_state["rollup"], st.session_state["scan_id"] = scan
                     st.session_state["report_summary"] = ""
                     st.session_state["report_pdf"] = None
                     st.success("Analysis Complete")
@@ -69,12 +106,12 @@ if st.session_state["data"] is not None:
 
     risks = df[df["status"] == "Risk"].sort_values("risk_score", ascending=False)
 
-    # Metrics
+    # Metrics (precomputed server-side in the scan rollup)
+    rollup = st.session_state["rollup"]
     c1, c2, c3 = st.columns(3)
-    c1.metric("Total Transactions", len(df))
-    c2.metric("Anomalies Detected", len(risks), delta_color="inverse")
-    total_risk_val = risks["amount"].sum() if not risks.empty else 0
-    c3.metric("Risk Value Exposure", f"${total_risk_val:,.2f}")
+    c1.metric("Total Transactions", rollup["total_transactions"])
+    c2.metric("Anomalies Detected", rollup["anomalies"], delta_color="inverse")
+    c3.metric("Risk Value Exposure", f"${rollup['risk_value']:,.2f}")
 
     st.divider()
 
@@ -86,15 +123,13 @@ if st.session_state["data"] is not None:
         if st.button("📝 Draft Audit Report"):
             with st.spinner("Consulting AI & Generating PDF..."):
                 try:
-                    payload = {"data": df.to_dict(orient="records")}
-                    res = requests.post(f"{API_URL}/generate_report", json=payload)
-
-                    if res.status_code == 200:
-                        result = res.json()
-                        st.session_state["report_summary"] = result["summary"]
-                        st.session_state["report_pdf"] = result["pdf_base64"]
-                    else:
-                        st.error("Report generation failed.")
+                    # The ledger stays on the server; only the scan id is sent.
+                    # The PDF is rendered as a job and downloaded as raw bytes.
+                    job = requests.post(f"{API_URL}/jobs/report", json={"scan_id": st.session_state["scan_id"]}).json()
+                    if wait_for_job(job, label="Report"):
+                        report = requests.get(f"{API_URL}/jobs/{job['job_id']}/report").json()
+                        st.session_state["report_summary"] = report["summary"]
+                        st.session_state["report_pdf"] = requests.get(f"{API_URL}{report['pdf_url']}").content
                 except Exception as e:
                     st.error(f"Error: {e}")
 
@@ -103,10 +138,9 @@ if st.session_state["data"] is not None:
             st.info(f"**AI Executive Summary:**\n\n{st.session_state['report_summary']}")
 
         if st.session_state["report_pdf"]:
-            pdf_data = base64.b64decode(st.session_state["report_pdf"])
             st.download_button(
                 label="📥 Download PDF Report",
-                data=pdf_data,
+                data=st.session_state["report_pdf"],
                 file_name="Audit_Exception_Report.pdf",
                 mime="application/pdf"
             )
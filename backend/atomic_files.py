@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+
+def write_atomic(path: str, write):
+    """
+    Calls `write(tmp_path)` on a uniquely named temp file next to `path`, then
+    moves it into place. Concurrent saves of the same key (e.g. a bulk scan of
+    identical exports) each get their own temp file; the caches are keyed by
+    content, so if another writer's file is already in place when the move
+    fails, that counts as saved.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,351 @@
+import gzip
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from atomic_files import write_atomic
+
+BASELINE_STORE_DIR = os.getenv("BASELINE_STORE_DIR", os.path.join(".bsef_cache", "baselines"))
+
+# Columns that influence the baseline; only these go into the fingerprint.
+FINGERPRINT_COLS = ["accounting_month", "vendor", "gl_code", "amount", "transaction_type", "cost_center"]
+
+# Default segment for per-segment z-scores
+SEGMENT_KEYS = ["vendor", "gl_code", "cost_center"]
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """
+    Chan/Welford parallel merge of (count, mean, M2) moments.
+    Works on scalars or aligned NumPy arrays; empty sides (count 0) are fine.
+    """
+    count = count_a + count_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = mean_b - mean_a
+        mean = np.where(count > 0, mean_a + delta * count_b / count, 0.0)
+        m2 = np.where(count > 0, m2_a + m2_b + delta ** 2 * count_a * count_b / count, 0.0)
+    return count, mean, m2
+
+
+def moments_std(count, m2):
+    """Sample std (ddof=1) from moments; NaN where fewer than two observations."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+
+
+class SegmentStats:
+    """
+    Running amount statistics per segment (e.g. vendor x GL x cost center),
+    stored as mergeable moments so a new month folds in with O(new rows) work.
+    """
+
+    def __init__(self, keys, frame: pd.DataFrame):
+        self.keys = list(keys)
+        # One row per segment: key columns + count, mean, m2
+        self.frame = frame.reset_index(drop=True)
+        self._index = pd.MultiIndex.from_frame(self.frame[self.keys])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, keys=SEGMENT_KEYS) -> "SegmentStats":
+        keys = [k for k in keys if k in df.columns]
+        grouped = df.groupby(keys, observed=True, sort=False)["amount"]
+        frame = grouped.agg(["count", "mean", "var"]).reset_index()
+        frame["m2"] = frame["var"].fillna(0.0) * (frame["count"] - 1)
+        frame["count"] = frame["count"].astype(float)
+        return cls(keys, frame[keys + ["count", "mean", "m2"]])
+
+    def decay(self, factor: float) -> "SegmentStats":
+        """Exponential time decay: older observations count for `factor` as much."""
+        frame = self.frame.copy()
+        frame["count"] *= factor
+        frame["m2"] *= factor
+        return SegmentStats(self.keys, frame)
+
+    def merge(self, other: "SegmentStats") -> "SegmentStats":
+        combined = self.frame.merge(other.frame, on=self.keys, how="outer", suffixes=("_a", "_b"))
+        combined = combined.fillna({c: 0.0 for c in ["count_a", "mean_a", "m2_a", "count_b", "mean_b", "m2_b"]})
+        count, mean, m2 = merge_moments(
+            combined["count_a"].to_numpy(), combined["mean_a"].to_numpy(), combined["m2_a"].to_numpy(),
+            combined["count_b"].to_numpy(), combined["mean_b"].to_numpy(), combined["m2_b"].to_numpy(),
+        )
+        frame = combined[self.keys].copy()
+        frame["count"], frame["mean"], frame["m2"] = count, mean, m2
+        return SegmentStats(self.keys, frame)
+
+    def lookup(self, df: pd.DataFrame):
+        """Per-row (count, mean, std) of each row's segment; count 0 / NaN if unseen."""
+        n = len(df)
+        if not self.keys or any(k not in df.columns for k in self.keys) or self.frame.empty:
+            return np.zeros(n), np.full(n, np.nan), np.full(n, np.nan)
+
+        pos = self._index.get_indexer(pd.MultiIndex.from_frame(df[self.keys]))
+        found = pos >= 0
+        pos = np.where(found, pos, 0)
+        count = np.where(found, self.frame["count"].to_numpy()[pos], 0.0)
+        mean = np.where(found, self.frame["mean"].to_numpy()[pos], np.nan)
+        std = np.where(found, moments_std(self.frame["count"].to_numpy(), self.frame["m2"].to_numpy())[pos], np.nan)
+        return count, mean, std
+
+    def to_dict(self) -> dict:
+        return {"keys": self.keys, "rows": self.frame.to_dict(orient="split")["data"]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SegmentStats":
+        columns = data["keys"] + ["count", "mean", "m2"]
+        return cls(data["keys"], pd.DataFrame(data["rows"], columns=columns))
+
+
+class BaselineIndex:
+    """
+    Everything the detector needs to know about closed months, built once
+    per scan from the historical slice:
+      - global amount mean / std (z-score context)
+      - known vendors and GL codes (novelty rules)
+      - known (vendor, transaction_type) pairs ("Unusual Type" rule)
+      - per-segment running moments (segment z-scores)
+    All lookups are hashed membership joins, so scoring stays O(rows).
+    Global and segment stats are kept as mergeable moments, so `extend()`
+    folds a newly closed month in without rescanning older history.
+    """
+
+    def __init__(self, mean, std, vendors, gl_codes, vendor_types, months=(), row_count=0, fingerprint=None,
+                 count=None, m2=None, segments: SegmentStats = None, digest: dict = None):
+        self.mean = mean
+        self.std = std
+        self.count = float(row_count if count is None else count)
+        if m2 is None:
+            m2 = std ** 2 * (self.count - 1) if self.count > 1 else 0.0
+        self.m2 = float(m2)
+        self.segments = segments
+        self.vendors = set(vendors)
+        self.gl_codes = set(gl_codes)
+        self.vendor_types = set(vendor_types)
+        self.months = sorted(months)
+        self.row_count = row_count
+        self.digest = digest
+        self.fingerprint = fingerprint if fingerprint is not None else (
+            fingerprint_from_digest(digest) if digest is not None else None
+        )
+
+    @classmethod
+    def from_history(cls, historical: pd.DataFrame) -> "BaselineIndex":
+        vendor_types = []
+        if "transaction_type" in historical.columns:
+            pairs = historical[["vendor", "transaction_type"]].drop_duplicates()
+            vendor_types = zip(pairs["vendor"].tolist(), pairs["transaction_type"].tolist())
+
+        months = []
+        if "accounting_month" in historical.columns:
+            months = historical["accounting_month"].unique().tolist()
+
+        amounts = historical["amount"]
+        std = float(amounts.std())
+        count = int(amounts.count())
+
+        return cls(
+            mean=float(amounts.mean()),
+            std=std,
+            vendors=historical["vendor"].unique().tolist(),
+            gl_codes=historical["gl_code"].unique().tolist(),
+            vendor_types=vendor_types,
+            months=months,
+            row_count=len(historical),
+            count=count,
+            m2=float(amounts.var()) * (count - 1) if count > 1 else 0.0,
+            segments=SegmentStats.from_frame(historical),
+            digest=digest_history(historical),
+        )
+
+    def decayed(self, factor: float) -> "BaselineIndex":
+        """Copy with existing history down-weighted by `factor` (exponential time decay)."""
+        return BaselineIndex(
+            mean=self.mean,
+            std=self.std,
+            vendors=self.vendors,
+            gl_codes=self.gl_codes,
+            vendor_types=self.vendor_types,
+            months=self.months,
+            row_count=self.row_count,
+            # Decayed stats no longer describe the raw rows; key them separately
+            fingerprint=_chain_fingerprint(self.fingerprint, f"decay={factor}"),
+            count=self.count * factor,
+            m2=self.m2 * factor,
+            segments=self.segments.decay(factor) if self.segments is not None else None,
+        )
+
+    def merge(self, other: "BaselineIndex") -> "BaselineIndex":
+        """
+        Union of two baselines (e.g. two months, or two chunks of one month).
+        Moments merge exactly; undecayed merges keep a content fingerprint equal
+        to building the baseline from all the rows at once.
+        """
+        count, mean, m2 = merge_moments(self.count, self.mean, self.m2, other.count, other.mean, other.m2)
+
+        segments = self.segments
+        if segments is None:
+            segments = other.segments
+        elif other.segments is not None and other.segments.keys == segments.keys:
+            segments = segments.merge(other.segments)
+
+        digest = merge_digests(self.digest, other.digest)
+        return BaselineIndex(
+            mean=float(mean),
+            std=float(moments_std(count, m2)),
+            vendors=self.vendors | other.vendors,
+            gl_codes=self.gl_codes | other.gl_codes,
+            vendor_types=self.vendor_types | other.vendor_types,
+            months=set(self.months) | set(other.months),
+            row_count=self.row_count + other.row_count,
+            fingerprint=None if digest is not None else _chain_fingerprint(self.fingerprint, other.fingerprint),
+            count=float(count),
+            m2=float(m2),
+            segments=segments,
+            digest=digest,
+        )
+
+    def extend(self, new_rows: pd.DataFrame, decay: float = None) -> "BaselineIndex":
+        """
+        Returns a new baseline with `new_rows` (e.g. a freshly closed month)
+        merged in, in O(len(new_rows)). With `decay` (0-1], existing history
+        is down-weighted by that factor before the merge.
+        """
+        base = self.decayed(decay) if decay is not None else self
+        return base.merge(BaselineIndex.from_history(new_rows))
+
+    def describes(self, historical: pd.DataFrame) -> bool:
+        """True when `historical` holds exactly the rows this baseline was built from (content digest)."""
+        if self.digest is None or len(historical) != self.digest["count"]:
+            return False
+        return digest_history(historical) == self.digest
+
+    def known_vendor(self, vendors: pd.Series) -> np.ndarray:
+        return vendors.isin(self.vendors).to_numpy()
+
+    def known_gl_code(self, gl_codes: pd.Series) -> np.ndarray:
+        return gl_codes.isin(self.gl_codes).to_numpy()
+
+    def known_vendor_type(self, vendors: pd.Series, types: pd.Series) -> np.ndarray:
+        if not self.vendor_types:
+            return np.zeros(len(vendors), dtype=bool)
+        pairs = pd.MultiIndex.from_arrays([vendors, types])
+        return pairs.isin(list(self.vendor_types))
+
+    # --- Serialization ---
+
+    def to_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "digest": self.digest,
+            "months": self.months,
+            "row_count": self.row_count,
+            "mean": self.mean,
+            "std": self.std,
+            "count": self.count,
+            "m2": self.m2,
+            "segments": self.segments.to_dict() if self.segments is not None else None,
+            "vendors": sorted(self.vendors, key=str),
+            "gl_codes": sorted(self.gl_codes, key=str),
+            "vendor_types": sorted(self.vendor_types, key=str),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BaselineIndex":
+        return cls(
+            mean=data["mean"],
+            std=data["std"],
+            vendors=data["vendors"],
+            gl_codes=data["gl_codes"],
+            vendor_types=[tuple(pair) for pair in data["vendor_types"]],
+            months=data.get("months", []),
+            row_count=data.get("row_count", 0),
+            fingerprint=data.get("fingerprint"),
+            digest=data.get("digest"),
+            count=data.get("count"),
+            m2=data.get("m2"),
+            segments=SegmentStats.from_dict(data["segments"]) if data.get("segments") else None,
+        )
+
+
+def digest_history(historical: pd.DataFrame) -> dict:
+    """
+    Order-independent, mergeable content digest of the rows a baseline is
+    built from: row count plus the wrapping sum and XOR of per-row hashes.
+    Digests of disjoint chunks merge into the digest of their union.
+    """
+    cols = [c for c in FINGERPRINT_COLS if c in historical.columns]
+    row_hashes = pd.util.hash_pandas_object(historical[cols], index=False).to_numpy()
+    return {
+        "cols": cols,
+        "count": len(row_hashes),
+        "sum": int(row_hashes.sum(dtype=np.uint64)),
+        "xor": int(np.bitwise_xor.reduce(row_hashes)) if len(row_hashes) else 0,
+    }
+
+
+def merge_digests(a: dict, b: dict):
+    if a is None or b is None or a["cols"] != b["cols"]:
+        return None
+    return {
+        "cols": a["cols"],
+        "count": a["count"] + b["count"],
+        "sum": (a["sum"] + b["sum"]) % 2 ** 64,
+        "xor": a["xor"] ^ b["xor"],
+    }
+
+
+def fingerprint_from_digest(digest: dict) -> str:
+    payload = json.dumps(digest, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def fingerprint_history(historical: pd.DataFrame) -> str:
+    """Order-independent content hash of the rows a baseline is built from."""
+    return fingerprint_from_digest(digest_history(historical))
+
+
+def _chain_fingerprint(*parts) -> str:
+    return hashlib.sha256(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class BaselineStore:
+    """
+    On-disk snapshots of closed-month baselines (gzipped JSON), keyed by the
+    history fingerprint. Closed months never change, so a month-end scan can
+    reference a stored baseline and upload only the current month.
+    """
+
+    def __init__(self, directory: str = BASELINE_STORE_DIR):
+        self.directory = directory
+
+    def _path(self, baseline_id: str) -> str:
+        # IDs are hex fingerprints; reject anything that could escape the directory
+        if not baseline_id or not all(c in "0123456789abcdef" for c in baseline_id):
+            raise ValueError(f"Invalid baseline id: {baseline_id!r}")
+        return os.path.join(self.directory, f"{baseline_id}.json.gz")
+
+    def exists(self, baseline_id: str) -> bool:
+        return os.path.exists(self._path(baseline_id))
+
+    def save(self, baseline: BaselineIndex) -> str:
+        path = self._path(baseline.fingerprint)
+        if os.path.exists(path):
+            return baseline.fingerprint
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write(tmp_path):
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(baseline.to_dict(), f, separators=(",", ":"))
+
+        write_atomic(path, write)
+        return baseline.fingerprint
+
+    def load(self, baseline_id: str) -> BaselineIndex:
+        path = self._path(baseline_id)
+        if not os.path.exists(path):
+            raise ValueError(f"Unknown baseline: {baseline_id}")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return BaselineIndex.from_dict(json.load(f))
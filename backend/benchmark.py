@@ -0,0 +1,206 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import llm_explainer
+from data_ingestion import ingest_dataframe
+from duplicates import DuplicatePaymentLayer
+from explanation_cache import ExplanationCache
+from isolation_forest import IsolationForestLayer
+from load_generator import LedgerSpec, iter_ledger_chunks
+from model import AnomalyModel
+from pdf_generator import create_audit_pdf
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+STAGES = ["ingest", "detect", "explain", "pdf"]
+
+# A stage regresses when it is slower (or peaks higher) than the baseline by
+# more than the tolerance AND by more than the absolute floor (noise guard).
+DEFAULT_TOLERANCE = 0.2
+MIN_REGRESSION_S = 0.05
+MIN_REGRESSION_MB = 1.0
+
+STUB_SUMMARY = "Benchmark summary. " * 20
+
+
+def build_raw_ledger(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic raw export (3 closed months + the current one), without labels."""
+    spec = LedgerSpec(months=4, rows_per_month=max(rows // 4, 1), seed=seed)
+    raw = pd.concat(iter_ledger_chunks(spec), ignore_index=True)
+    return raw.drop(columns=["is_anomaly", "anomaly_type"])
+
+
+def stub_llm(latency_s: float):
+    """Replaces the model call in llm_explainer with a fixed-latency local stub."""
+
+    def fake_request(transactions: list) -> dict:
+        time.sleep(latency_s)
+        return {t["id"]: f"Stub note: {t['flag']}" for t in transactions}
+
+    llm_explainer._request_explanations = fake_request
+
+
+class StageRunner:
+    """Runs the pipeline stages on one ledger, feeding each stage the previous output."""
+
+    def __init__(self, raw: pd.DataFrame, detector: AnomalyModel, workdir: str):
+        self.raw = raw
+        self.detector = detector
+        self.workdir = workdir
+        self.ingested = None
+        self.scored = None
+        self.explained = None
+        self._runs = 0
+
+    def ingest(self):
+        self.ingested = ingest_dataframe(self.raw.copy())
+
+    def detect(self):
+        self.scored = self.detector.detect_anomalies(self.ingested)
+
+    def explain(self):
+        # Fresh cache each run, so every risk goes through the stubbed model
+        self._runs += 1
+        path = os.path.join(self.workdir, f"explanations_{len(self.raw)}_{self._runs}.sqlite3")
+        llm_explainer.explanation_cache = ExplanationCache(path=path)
+        self.explained = llm_explainer.explain_anomalies(self.scored)
+
+    def pdf(self):
+        risks = self.explained[self.explained["status"] == "Risk"]
+        create_audit_pdf(risks, STUB_SUMMARY, len(self.explained), risks["amount"].sum())
+
+
+def measure(fn, repeat: int = 1, track_memory: bool = True) -> dict:
+    """Best-of-`repeat` wall time, then one traced run for peak Python/NumPy memory."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = round(peak / 1024 ** 2, 2)
+
+    return {"wall_s": round(best, 4), "peak_mb": peak_mb}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=STAGES, llm_latency_s: float = 0.2, repeat: int = 1,
+                   isolation_forest: bool = False, track_memory: bool = True, seed: int = 0) -> dict:
+    stub_llm(llm_latency_s)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        layer = IsolationForestLayer(cache_dir=os.path.join(workdir, "models")) if isolation_forest else None
+        # Same detect stage as production (main.py): duplicate check always on
+        detector = AnomalyModel(isolation_forest=layer, duplicates=DuplicatePaymentLayer())
+
+        for rows in sizes:
+            runner = StageRunner(build_raw_ledger(rows, seed), detector, workdir)
+            n = len(runner.raw)
+            # Stages depend on each other's output, so earlier ones always run
+            for stage in STAGES[:max(STAGES.index(s) for s in stages) + 1]:
+                stats = measure(getattr(runner, stage), repeat, track_memory)
+                if stage not in stages:
+                    continue
+                stats.update(stage=stage, rows=n, rows_per_s=round(n / stats["wall_s"], 1) if stats["wall_s"] else None)
+                print(f"⏱️ {stage:<8} {n:>9} rows  {stats['wall_s']:>8.3f} s  {stats['peak_mb']} MB")
+                results.append(stats)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "llm_latency_s": llm_latency_s,
+            "repeat": repeat,
+            "isolation_forest": isolation_forest,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """Regressions of `current` vs `baseline`, matched by (stage, rows)."""
+    previous = {(r["stage"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = previous.get((result["stage"], result["rows"]))
+        if base is None:
+            continue
+        checks = [("wall_s", MIN_REGRESSION_S), ("peak_mb", MIN_REGRESSION_MB)]
+        for metric, floor in checks:
+            new, old = result.get(metric), base.get(metric)
+            if new is None or old is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append({
+                    "stage": result["stage"], "rows": result["rows"], "metric": metric,
+                    "baseline": old, "current": new, "change": round(new / old - 1, 3) if old else None,
+                })
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage benchmark: ingest -> detect -> explain -> pdf")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated ledger sizes (rows)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"subset of {','.join(STAGES)}")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="latency of the stubbed model call")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage (best is kept)")
+    parser.add_argument("--isolation-forest", action="store_true", help="include the Isolation Forest layer")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown / memory growth before flagging")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)}")
+
+    report = run_benchmarks(
+        sizes=[int(s) for s in args.sizes.split(",")], stages=stages, llm_latency_s=args.llm_latency_ms / 1000,
+        repeat=args.repeat, isolation_forest=args.isolation_forest, track_memory=not args.no_memory,
+        seed=args.seed,
+    )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        report["meta"]["baseline"] = args.baseline
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    for r in report.get("regressions", []):
+        change = f" ({r['change']:+.0%})" if r["change"] is not None else ""
+        print(f"❌ Regression: {r['stage']} @ {r['rows']} rows, {r['metric']} {r['baseline']} -> {r['current']}{change}")
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
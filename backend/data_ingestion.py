@@ -1,19 +1,121 @@
 import pandas as pd
 
+# Map CSV variations to internal standard
+COLUMN_MAPPING = {
+    "transaction_amount": "amount",
+    "amt": "amount",
+    "cost center": "cost_center",
+    "gl code": "gl_code",
+    "transaction type": "transaction_type",
+    "company": "entity",
+    "company code": "entity",
+    "company_code": "entity",
+    "legal entity": "entity",
+    "legal_entity": "entity",
+    "subsidiary": "entity",
+}
 
-def ingest_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+# Declared parse dtypes (by internal column name) so the CSV parser never
+# has to infer types or hold intermediate object columns.
+CSV_DTYPES = {
+    "amount": "float64",
+    "vendor": "str",
+    "cost_center": "str",
+    "entity": "str",
+    "transaction_type": "str",
+    "accounting_month": "str",
+}
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Low-cardinality columns kept as categoricals (small integer codes + one
+# copy of each distinct value) once ingested.
+CATEGORICAL_COLS = ["vendor", "gl_code", "cost_center", "entity", "transaction_type"]
+
+
+def _internal_name(column: str) -> str:
+    column = column.lower()
+    return COLUMN_MAPPING.get(column, column)
+
+
+def _ledger_dtypes(path):
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {col: CSV_DTYPES[_internal_name(col)] for col in header if _internal_name(col) in CSV_DTYPES}
+    date_cols = [col for col in header if _internal_name(col) == "date"]
+    return dtypes, date_cols
+
+
+def _parse_dates(df: pd.DataFrame, date_cols, date_format: str) -> pd.DataFrame:
+    for col in date_cols:
+        try:
+            df[col] = pd.to_datetime(df[col], format=date_format)
+        except (ValueError, TypeError):
+            # Export uses another layout; fall back to per-value inference
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def read_ledger_csv(path, date_format: str = DATE_FORMAT) -> pd.DataFrame:
+    """
+    Parses a ledger CSV from disk with declared dtypes and an explicit date
+    format. Raw column names may use any of the supported variations.
+    """
+    dtypes, date_cols = _ledger_dtypes(path)
+    return _parse_dates(pd.read_csv(path, dtype=dtypes), date_cols, date_format)
+
+
+def iter_ledger_csv(path, chunksize: int, date_format: str = DATE_FORMAT):
+    """Same parsing as read_ledger_csv, yielding `chunksize`-row frames."""
+    dtypes, date_cols = _ledger_dtypes(path)
+    with pd.read_csv(path, dtype=dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _parse_dates(chunk, date_cols, date_format)
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def _month_codes(months) -> pd.Categorical:
+    """Ordered categorical of 'YYYY-MM' labels; accepts Periods or strings."""
+    codes, uniques = pd.factorize(months, sort=True)
+    return pd.Categorical.from_codes(codes, categories=uniques.astype(str), ordered=True)
+
+
+def compact_ledger(df: pd.DataFrame, report_memory: bool = False) -> pd.DataFrame:
+    """
+    Shrinks an ingested ledger: categoricals for the low-cardinality columns,
+    float64 amounts, and accounting months as ordered integer period codes.
+    Values (and their string forms) are unchanged. `report_memory` logs the
+    size before and after (a deep scan of every column, so off for chunks).
+    """
+    before = memory_mb(df) if report_memory else None
+
+    for col in CATEGORICAL_COLS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    df["amount"] = df["amount"].astype("float64")
+
+    if "accounting_month" in df.columns and not isinstance(df["accounting_month"].dtype, pd.CategoricalDtype):
+        df["accounting_month"] = _month_codes(df["accounting_month"])
+
+    if report_memory:
+        print(f"📦 Ledger memory: {before:.2f} MB -> {memory_mb(df):.2f} MB ({len(df)} rows)")
+    return df
+
+
+def ingest_dataframe(df: pd.DataFrame, id_offset: int = 0, compact: bool = True,
+                     report_memory: bool = False) -> pd.DataFrame:
+    """
+    Normalizes a raw ledger to the internal schema. `id_offset` numbers
+    generated ids when the ledger is ingested in chunks; `compact` applies
+    compact_ledger() (`report_memory` is passed on to it).
+    """
     # Normalize column names to lowercase
     df.columns = [c.lower() for c in df.columns]
 
-    # Map CSV variations to internal standard
-    col_mapping = {
-        "transaction_amount": "amount",
-        "amt": "amount",
-        "cost center": "cost_center",
-        "gl code": "gl_code",
-        "transaction type": "transaction_type"
-    }
-    df = df.rename(columns=col_mapping)
+    df = df.rename(columns=COLUMN_MAPPING)
 
     # Required internal schema
     required_cols = {"amount", "vendor", "gl_code"}
@@ -23,11 +125,15 @@ def ingest_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 
     # Create 'id' if missing
     if "id" not in df.columns:
-        df["id"] = range(1, len(df) + 1)
+        df["id"] = range(id_offset + 1, id_offset + len(df) + 1)
 
     # Ensure Accounting Month exists (derive from date if missing)
     if "accounting_month" not in df.columns and "date" in df.columns:
         df["date"] = pd.to_datetime(df["date"])
-        df["accounting_month"] = df["date"].dt.to_period("M").astype(str)
+        # Period ordinals -> codes directly; no per-row month strings are built
+        df["accounting_month"] = _month_codes(df["date"].dt.to_period("M"))
+
+    if compact:
+        df = compact_ledger(df, report_memory=report_memory)
 
-    return df
\ No newline at end of file
+    return df
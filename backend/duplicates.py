@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+NO_MATCH, NEAR_DUPLICATE, EXACT_DUPLICATE = 0, 1, 2
+MATCH_COLS = ["dup_kind", "dup_match", "dup_diff", "dup_apart"]
+
+
+def _day_numbers(df: pd.DataFrame):
+    """Days since epoch per row (int64) and a validity mask; no usable date -> invalid."""
+    if "date" not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), np.zeros(len(df), dtype=bool)
+    dates = pd.to_datetime(df["date"], errors="coerce")
+    valid = dates.notna().to_numpy()
+    days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    return np.where(valid, days, 0), valid
+
+
+def _sort_order(*keys) -> np.ndarray:
+    """
+    Stable argsort by several non-negative int keys (most significant first).
+    Packs them into one int64 when their ranges allow it (far faster than lexsort).
+    """
+    span = 1
+    for key in keys:
+        span *= int(key.max()) + 1 if len(key) else 1
+    if span >= 2 ** 62:
+        return np.lexsort(keys[::-1])
+    packed = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        packed = packed * (int(key.max()) + 1) + key
+    return np.argsort(packed, kind="stable")
+
+
+def _run_starts(same_as_prev: np.ndarray) -> np.ndarray:
+    """For each sorted position, the position where its run of equal keys begins."""
+    starts = np.where(same_as_prev, 0, np.arange(len(same_as_prev)))
+    return np.maximum.accumulate(starts) if len(starts) else starts
+
+
+def _codes(df: pd.DataFrame, columns) -> np.ndarray:
+    """One non-negative int code per distinct combination of `columns` (-1 if any is missing)."""
+    codes = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        col_codes, uniques = pd.factorize(df[col])
+        codes = np.where((codes < 0) | (col_codes < 0), -1, codes * (len(uniques) + 1) + col_codes)
+        # Re-number so the packed code stays small however many columns are combined
+        codes = np.where(codes < 0, -1, pd.factorize(codes)[0])
+    return codes
+
+
+def _id_rank(df: pd.DataFrame) -> np.ndarray:
+    """Rank of each row's id (row position without one): the tie-break between same-day rows."""
+    if "id" not in df.columns:
+        return np.arange(len(df), dtype=np.int64)
+    return pd.factorize(df["id"], sort=True)[0].astype(np.int64)
+
+
+class DuplicatePaymentLayer:
+    """
+    Duplicate / split-invoice check. Instead of comparing every pair of
+    payments, rows are sorted once by (vendor, amount, date), so each one
+    only meets its neighbours: O(n log n) for the whole ledger.
+      - exact duplicate: same vendor, amount and date as an earlier row
+      - near duplicate: same vendor and `near_keys` (GL code), amount within
+        `amount_tolerance` (relative), dated at most `window_days` after an
+        earlier row
+    The later row of a pair (by date, then id) is the one flagged; the
+    earlier is its match. Exact duplicates raise risk to `exact_floor`; near
+    ones never raise it (similar amounts are common in a busy segment) and
+    are only reported on rows another signal already flags.
+    """
+
+    def __init__(self, window_days: int = 7, amount_tolerance: float = 0.005, exact_floor: float = 0.8,
+                 near_keys=("gl_code",)):
+        self.window_days = window_days
+        self.amount_tolerance = amount_tolerance
+        self.exact_floor = exact_floor
+        self.near_keys = tuple(near_keys)
+
+    @property
+    def columns(self) -> list:
+        """Ledger columns find() reads; enough to match a ledger scored in parts."""
+        return ["id", "vendor", "amount", "date"] + list(self.near_keys)
+
+    def matches(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        find() as a frame aligned with `df` (same index): dup_kind, dup_match
+        (the earlier row's id), dup_diff and dup_apart.
+        """
+        kind, match, diff, apart = self.find(df)
+        ids = df["id"] if "id" in df.columns else pd.Series(np.arange(1, len(df) + 1))
+        ids = ids.astype(str).to_numpy(dtype=object)
+        return pd.DataFrame({
+            "dup_kind": kind,
+            "dup_match": np.where(match >= 0, ids[np.maximum(match, 0)], ""),
+            "dup_diff": diff,
+            "dup_apart": apart,
+        }, index=df.index)
+
+    def find(self, df: pd.DataFrame):
+        """
+        Returns (kind, match, amount_diff, days_apart) per row: kind is
+        NO_MATCH / NEAR_DUPLICATE / EXACT_DUPLICATE, match the position of
+        the earlier row (-1 if none), amount_diff the relative difference.
+        """
+        n = len(df)
+        kind = np.zeros(n, dtype=np.int8)
+        match = np.full(n, -1, dtype=np.int64)
+        diff = np.zeros(n)
+        apart = np.zeros(n, dtype=np.int64)
+        if n < 2 or "vendor" not in df.columns:
+            return kind, match, diff, apart
+
+        vendor, _ = pd.factorize(df["vendor"])
+        amount_code, _ = pd.factorize(df["amount"])
+        amounts = df["amount"].to_numpy(dtype=float)
+        days, valid = _day_numbers(df)
+        days_key = days - days[valid].min() if valid.any() else days
+        rank = _id_rank(df)
+        usable = valid & (vendor >= 0) & (amount_code >= 0)
+
+        # Exact: runs of equal (vendor, amount, date); later rows match the run's first row
+        order = _sort_order(np.where(usable, vendor, 0), np.where(usable, amount_code, 0),
+                            np.where(usable, days_key, 0), rank)
+        order = order[usable[order]]
+        v, a, d = vendor[order], amount_code[order], days[order]
+        same = np.zeros(len(order), dtype=bool)
+        same[1:] = (v[1:] == v[:-1]) & (a[1:] == a[:-1]) & (d[1:] == d[:-1])
+        exact_rows = order[same]
+        kind[exact_rows] = EXACT_DUPLICATE
+        match[exact_rows] = order[_run_starts(same)][same]
+
+        # Near: amounts within the tolerance are at most half a band apart in
+        # log space, so they share a band of at least one of two half-offset
+        # grids. Within a (vendor, keys, sign, band) group rows are in (date,
+        # id) order: each compares with its predecessors until one falls
+        # outside the group or the date window, so no pair is missed.
+        keys = [c for c in self.near_keys if c in df.columns]
+        group = _codes(df, ["vendor"] + keys)
+        near = usable & (group >= 0) & (amounts != 0)
+        width = -2 * np.log1p(-self.amount_tolerance)
+        log_amount = np.log(np.abs(np.where(near, amounts, 1.0)))
+        negative = (amounts < 0).astype(np.int64)
+        for offset in (0.0, 0.5):
+            band = np.floor(log_amount / width + offset).astype(np.int64)
+            band = np.where(near, band - band[near].min(), 0) if near.any() else band
+            order = _sort_order(np.where(near, group, 0), negative, band, np.where(near, days_key, 0), rank)
+            order = order[near[order]]
+            g, s, b, d, amt = group[order], negative[order], band[order], days[order], amounts[order]
+
+            later = np.arange(1, len(order))
+            k = 1
+            while len(later):
+                earlier = later - k
+                close = (g[later] == g[earlier]) & (s[later] == s[earlier]) & (b[later] == b[earlier]) \
+                    & (d[later] - d[earlier] <= self.window_days)
+                later, earlier = later[close], earlier[close]
+                rel = np.abs(amt[later] - amt[earlier]) / np.maximum(np.abs(amt[later]), np.abs(amt[earlier]))
+                # Nearest earlier row first (k grows), so the closest in time wins
+                hit = (rel <= self.amount_tolerance) & (kind[order[later]] == NO_MATCH)
+                rows = order[later[hit]]
+                kind[rows] = NEAR_DUPLICATE
+                match[rows] = order[earlier[hit]]
+                diff[rows] = rel[hit]
+                apart[rows] = (d[later] - d[earlier])[hit]
+                k += 1
+                later = later[later >= k]
+
+        return kind, match, diff, apart
+
+
+def align_matches(matches: pd.DataFrame, index) -> pd.DataFrame:
+    """`matches` (possibly only the matched rows) reindexed to `index`; missing rows are NO_MATCH."""
+    aligned = matches.reindex(index)
+    return aligned.fillna({"dup_kind": NO_MATCH, "dup_match": "", "dup_diff": 0.0, "dup_apart": 0})
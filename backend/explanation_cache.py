@@ -0,0 +1,123 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+EXPLANATION_CACHE_PATH = os.getenv(
+    "EXPLANATION_CACHE_PATH", os.path.join(".bsef_cache", "explanations.sqlite3")
+)
+
+# Numbers inside reason strings that vary without changing the story;
+# they are bucketed before hashing so near-identical flags share a note.
+_REASON_BANDS = [
+    (re.compile(r"(\d+(?:\.\d+)?)x std dev"), lambda m: f"{round(float(m.group(1)))}x std dev"),
+    (re.compile(r"score (\d\.\d+)"), lambda m: f"score {float(m.group(1)):.1f}"),
+]
+
+
+def amount_band(amount) -> str:
+    """Two significant figures: 1,234.56 and 1,180.00 share the band '1.2e+03'."""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return "na"
+    if math.isnan(amount):
+        return "na"
+    return f"{amount:.2g}"
+
+
+def explanation_key(vendor, amount, flag) -> str:
+    """Normalized fingerprint of the fields that go into an explanation prompt."""
+    reason = " ".join(str(flag).lower().split())
+    for pattern, bucket in _REASON_BANDS:
+        reason = pattern.sub(bucket, reason)
+    vendor = " ".join(str(vendor).lower().split())
+    payload = json.dumps([vendor, amount_band(amount), reason])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """
+    Two-level cache of LLM audit notes: an in-process LRU in front of a
+    SQLite store on disk, so notes survive restarts and are shared by
+    workers. Hit/miss counters show how many model calls were saved.
+    """
+
+    def __init__(self, path: str = EXPLANATION_CACHE_PATH, memory_size: int = 4096):
+        self.path = path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS explanations (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commits on success
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, text: str):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys) -> dict:
+        """{key: text} for every cached key; missing keys are simply absent."""
+        found, pending = {}, []
+        with self._lock:
+            for key in set(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    pending.append(key)
+            self.stats["memory_hits"] += len(found)
+
+        disk = {}
+        if pending:
+            with self._connect() as conn:
+                for i in range(0, len(pending), 500):
+                    batch = pending[i:i + 500]
+                    marks = ",".join("?" * len(batch))
+                    rows = conn.execute(f"SELECT key, text FROM explanations WHERE key IN ({marks})", batch)
+                    disk.update(rows.fetchall())
+
+        with self._lock:
+            for key, text in disk.items():
+                self._remember(key, text)
+            self.stats["disk_hits"] += len(disk)
+            self.stats["misses"] += len(pending) - len(disk)
+
+        found.update(disk)
+        return found
+
+    def put_many(self, items: dict):
+        if not items:
+            return
+        with self._lock:
+            for key, text in items.items():
+                self._remember(key, text)
+            self.stats["writes"] += len(items)
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO explanations (key, text) VALUES (?, ?)", list(items.items()))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
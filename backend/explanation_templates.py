@@ -0,0 +1,75 @@
+import re
+
+import pandas as pd
+
+# Marker for notes rendered locally (LLM notes keep the 🤖 marker)
+LOCAL_NOTE_PREFIX = "📝"
+
+
+def _money(value) -> str:
+    try:
+        return f"${float(value):,.2f}"
+    except (TypeError, ValueError):
+        return "an unknown amount"
+
+
+def _typical(typical) -> str:
+    if typical is None or typical != typical:  # NaN-safe
+        return ""
+    return f" (typical ≈ {_money(typical)})"
+
+
+# One template per single-reason shape produced by AnomalyModel.
+# Each renderer gets (row, regex match, typical): the mean the row's z-score
+# was measured against (global or segment), or None when unknown.
+TEMPLATES = [
+    (re.compile(r"Extreme Spike \((?P<z>[\d.]+)x std dev\)"),
+     lambda row, m, b: f"Amount {_money(row.get('amount'))} is {m['z']}x std dev from the norm{_typical(b)}. "
+                       f"Verify the invoice, approval and a possible keying error before posting."),
+    (re.compile(r"Unusual Variance \((?P<z>[\d.]+)x std dev\)"),
+     lambda row, m, b: f"Amount {_money(row.get('amount'))} is {m['z']}x std dev from the norm{_typical(b)}. "
+                       f"Confirm the business reason with the cost center owner."),
+    (re.compile(r"Moderate Deviation \((?P<z>[\d.]+)x std dev\)"),
+     lambda row, m, b: f"Amount {_money(row.get('amount'))} deviates {m['z']}x std dev from the norm{_typical(b)}. "
+                       f"Low priority; review if it recurs."),
+    (re.compile(r"New Vendor: (?P<vendor>.+)"),
+     lambda row, m, b: f"First transaction with {m['vendor']} ({_money(row.get('amount'))}). "
+                       f"Confirm vendor master setup, bank details and a matching PO before payment."),
+    (re.compile(r"New GL Code: (?P<gl>.+)"),
+     lambda row, m, b: f"GL {m['gl']} has no postings in prior months. "
+                       f"Confirm the account mapping is correct and approved."),
+    (re.compile(r"Unusual Type '(?P<type>.+)' for this vendor"),
+     lambda row, m, b: f"{row.get('vendor')} has never had a '{m['type']}' entry before. "
+                       f"Review the supporting documentation and who raised it."),
+    (re.compile(r"Duplicate Payment: same vendor, amount and date as #(?P<match>.+)"),
+     lambda row, m, b: f"{row.get('vendor')} was already paid {_money(row.get('amount'))} on the same date "
+                       f"(transaction #{m['match']}). Hold payment until the invoice is confirmed as distinct."),
+    (re.compile(r"Isolation Forest Outlier \(score (?P<score>[\d.]+)\)"),
+     lambda row, m, b: f"The vendor / account / amount combination ({_money(row.get('amount'))}) is unusual "
+                       f"versus history (outlier score {m['score']}). Review for misposting."),
+]
+
+
+def render_local_note(row, typical=None):
+    """Audit note for a known single-reason shape, or None to escalate to the LLM."""
+    reason = str(row.get("anomaly_reason", ""))
+    for pattern, render in TEMPLATES:
+        match = pattern.fullmatch(reason)
+        if match:
+            return render(row, match, typical)
+    # Combined ("a; b") or unrecognised reasons need the model
+    return None
+
+
+def local_explanations(risk_rows: pd.DataFrame, typical: pd.Series = None) -> dict:
+    """
+    {str(index): note} for every risk row a template can explain.
+    `typical` (by index) is each row's reference mean; rows without one get no "typical" clause.
+    """
+    notes = {}
+    typical = typical.reindex(risk_rows.index) if typical is not None else pd.Series(None, index=risk_rows.index)
+    for idx, row, ref in zip(risk_rows.index, risk_rows.to_dict(orient="records"), typical.tolist()):
+        note = render_local_note(row, ref)
+        if note is not None:
+            notes[str(idx)] = note
+    return notes
@@ -76,6 +76,9 @@ def generate_month(month, with_anomalies=False):
         "date": f"{month}-31"
     })
 
+    # 5. HIGH RISK: Duplicate Payment (first invoice of the month entered twice)
+    data.append(dict(data[0]))
+
     return pd.DataFrame(data)
 
 
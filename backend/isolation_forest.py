@@ -0,0 +1,176 @@
+import glob
+import os
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from atomic_files import write_atomic
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(".bsef_cache", "models"))
+# Forest files kept on disk (least recently used go first); ~0.5 MB each
+MODEL_CACHE_MAX_FILES = int(os.getenv("MODEL_CACHE_MAX_FILES", "64"))
+
+# Categorical columns encoded by how common each value was in history
+CATEGORICAL_FEATURES = ["vendor", "gl_code", "cost_center"]
+
+
+def _signed_log(values: np.ndarray) -> np.ndarray:
+    return np.sign(values) * np.log1p(np.abs(values))
+
+
+def build_encoders(historical: pd.DataFrame) -> dict:
+    """Frequency tables + per-vendor typical (log) amount, learned from history."""
+    encoders = {}
+    for col in CATEGORICAL_FEATURES:
+        if col in historical.columns:
+            encoders[col] = historical[col].value_counts(normalize=True)
+
+    log_amount = pd.Series(_signed_log(historical["amount"].to_numpy(dtype=float)), index=historical.index)
+    encoders["vendor_log_amount"] = log_amount.groupby(historical["vendor"], observed=True).mean()
+    return encoders
+
+
+def encode_features(df: pd.DataFrame, encoders: dict) -> np.ndarray:
+    """
+    Vectorized feature matrix:
+      - signed log amount
+      - log amount relative to the vendor's historical typical amount
+      - historical frequency of vendor / GL code / cost center (unseen -> 0)
+    """
+    log_amount = _signed_log(df["amount"].to_numpy(dtype=float))
+    vendor_typical = df["vendor"].map(encoders["vendor_log_amount"]).to_numpy(dtype=float)
+    relative = np.where(np.isnan(vendor_typical), 0.0, log_amount - vendor_typical)
+
+    columns = [log_amount, relative]
+    for col in CATEGORICAL_FEATURES:
+        if col not in encoders:
+            continue
+        if col in df.columns:
+            freq = df[col].map(encoders[col]).to_numpy(dtype=float)
+        else:
+            freq = np.full(len(df), np.nan)
+        columns.append(np.nan_to_num(freq, nan=0.0))
+
+    return np.nan_to_num(np.column_stack(columns), nan=0.0)
+
+
+class IsolationForestLayer:
+    """
+    Layer 2 of the ensemble. One forest is fitted per baseline fingerprint
+    and cached (in-process LRU + joblib file on disk, at most `max_files`
+    files), so repeated scans against the same closed months never refit.
+    Scoring runs in row batches spread over `n_jobs` threads.
+    """
+
+    def __init__(self, cache_dir: str = MODEL_CACHE_DIR, n_estimators: int = 100, contamination: float = 0.01,
+                 batch_size: int = 50_000, n_jobs: int = -1, min_train_rows: int = 20,
+                 random_state: int = 42, memory_slots: int = 8, max_files: int = MODEL_CACHE_MAX_FILES):
+        self.cache_dir = cache_dir
+        self.n_estimators = n_estimators
+        self.contamination = contamination
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.min_train_rows = min_train_rows
+        self.random_state = random_state
+        self.memory_slots = memory_slots
+        self.max_files = max_files
+        self._memory = OrderedDict()
+
+    def __getstate__(self):
+        # Fitted forests stay in this process; a copy (e.g. in a worker process) reloads them from disk
+        state = self.__dict__.copy()
+        state["_memory"] = OrderedDict()
+        return state
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"iforest_{fingerprint}.joblib")
+
+    def fit(self, historical: pd.DataFrame) -> dict:
+        encoders = build_encoders(historical)
+        forest = IsolationForest(
+            n_estimators=self.n_estimators,
+            contamination=self.contamination,
+            n_jobs=self.n_jobs,
+            random_state=self.random_state,
+        )
+        forest.fit(encode_features(historical, encoders))
+        return {"forest": forest, "encoders": encoders}
+
+    def get_model(self, fingerprint: str, historical: pd.DataFrame = None):
+        """
+        Cached model for `fingerprint`; fits (and caches) one from `historical`
+        on a miss. Returns None when nothing is cached and there is too little
+        history to train on.
+        """
+        if fingerprint in self._memory:
+            self._memory.move_to_end(fingerprint)
+            return self._memory[fingerprint]
+
+        path = self._path(fingerprint) if fingerprint else None
+        fitted = self._load(path) if path else None
+        if fitted is None:
+            if historical is None or len(historical) < self.min_train_rows:
+                return None
+            fitted = self.fit(historical)
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                write_atomic(path, lambda tmp_path: joblib.dump(fitted, tmp_path))
+                self._evict()
+
+        if fingerprint:
+            self._memory[fingerprint] = fitted
+            while len(self._memory) > self.memory_slots:
+                self._memory.popitem(last=False)
+        return fitted
+
+    def has_model(self, fingerprint: str) -> bool:
+        """Whether a forest for `fingerprint` is cached (in memory or on disk)."""
+        return fingerprint in self._memory or bool(fingerprint) and os.path.exists(self._path(fingerprint))
+
+    def _load(self, path: str):
+        """Forest file at `path`, or None (also when evicted by another scan since the check)."""
+        try:
+            fitted = joblib.load(path)
+            os.utime(path)  # keep recently used forests out of the eviction window
+        except FileNotFoundError:
+            return None
+        return fitted
+
+    def _evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "iforest_*.joblib")):
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass  # removed by a concurrent eviction
+        for _, path in sorted(entries)[:-self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def score(self, fitted: dict, df: pd.DataFrame):
+        """
+        Returns (anomaly_score, is_outlier) for each row of `df`.
+        anomaly_score is the paper's s(x) in (0, 1): ~0.5 typical, -> 1 isolated.
+        """
+        if df.empty:
+            return np.zeros(0), np.zeros(0, dtype=bool)
+
+        forest = fitted["forest"]
+        X = encode_features(df, fitted["encoders"])
+        batches = [X[i:i + self.batch_size] for i in range(0, len(X), self.batch_size)]
+
+        if len(batches) == 1:
+            raw = forest.score_samples(X)
+        else:
+            parts = joblib.Parallel(n_jobs=self.n_jobs, prefer="threads")(
+                joblib.delayed(forest.score_samples)(batch) for batch in batches
+            )
+            raw = np.concatenate(parts)
+
+        # decision_function is score_samples shifted by the contamination cut-off
+        return -raw, (raw - forest.offset_) < 0
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "2"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    One background scan. Work functions receive the Job and report through
+    `update()`, which is also where cooperative cancellation takes effect.
+    """
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> done | failed | cancelled
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def update(self, stage: str, progress: float):
+        self.check_cancelled()
+        self.stage = stage
+        self.progress = progress
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "elapsed_s": round(end - (self.started_at or end), 3),
+            "queued_s": round((self.started_at or end) - self.created_at, 3),
+        }
+
+
+class JobQueue:
+    """
+    Bounded worker pool for scans. At most `max_workers` jobs run at once;
+    the rest wait in FIFO order. Finished jobs are kept (oldest evicted
+    first) so clients can poll for results.
+    """
+
+    def __init__(self, max_workers: int = SCAN_JOB_WORKERS, max_jobs: int = 200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, fn, *args, kind: str = "scan", cleanup=None, **kwargs) -> Job:
+        """Queues fn(job, *args, **kwargs). `cleanup()` always runs afterwards."""
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs, cleanup)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Requests cancellation; queued jobs never start, running ones stop at their next stage."""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        return True
+
+    def counts(self) -> dict:
+        """{status: number of jobs} over the jobs still tracked."""
+        counts = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _run(self, job: Job, fn, args, kwargs, cleanup):
+        try:
+            job.check_cancelled()
+            job.status = "running"
+            job.started_at = time.time()
+            job.result = fn(job, *args, **kwargs)
+            job.status, job.stage, job.progress = "done", "done", 1.0
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            if cleanup is not None:
+                cleanup()
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in finished[:max(excess, 0)]:
+            del self._jobs[job_id]
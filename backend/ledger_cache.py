@@ -0,0 +1,69 @@
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from atomic_files import write_atomic
+
+LEDGER_CACHE_DIR = os.getenv("LEDGER_CACHE_DIR", os.path.join(".bsef_cache", "ledgers"))
+
+
+class LedgerCache:
+    """
+    Normalized (post-ingest) ledgers stored as uncompressed Arrow IPC files,
+    keyed by the SHA-256 of the uploaded bytes. A repeat scan of the same
+    export memory-maps the columns back instead of re-parsing the CSV,
+    renaming columns and deriving accounting months.
+    """
+
+    def __init__(self, directory: str = LEDGER_CACHE_DIR, max_entries: int = 64):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def _path(self, content_hash: str) -> str:
+        if not content_hash or not all(c in "0123456789abcdef" for c in content_hash):
+            raise ValueError(f"Invalid content hash: {content_hash!r}")
+        return os.path.join(self.directory, f"{content_hash}.arrow")
+
+    def load(self, content_hash: str):
+        """
+        Cached ledger for `content_hash`, or None on a miss. The columns are
+        memory-mapped, then copied into pandas column by column (each mapped
+        buffer is released once converted), so loading peaks at about one
+        copy of the ledger.
+        """
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)  # keep recently used entries out of the eviction window
+        except FileNotFoundError:
+            # Evicted by a concurrent save() since the exists() check
+            return None
+        return table.to_pandas(self_destruct=True, split_blocks=True)
+
+    def save(self, content_hash: str, df: pd.DataFrame):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(content_hash)
+        # Uncompressed so later reads can be memory-mapped without decoding
+        write_atomic(path, lambda tmp_path: feather.write_feather(df.reset_index(drop=True), tmp_path,
+                                                                  compression="uncompressed"))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.arrow")):
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass  # removed by a concurrent eviction
+        for _, path in sorted(entries)[:-self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,10 +1,17 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from explanation_cache import ExplanationCache, explanation_key
+from explanation_templates import LOCAL_NOTE_PREFIX, local_explanations
+from llm_router import ModelRouter
+from metrics import metrics
+from rollups import build_rollup
+
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 
@@ -15,6 +22,15 @@ else:
 
 client = genai.Client(api_key=API_KEY) if API_KEY else None
 
+# Audit notes already written for the same vendor / amount band / flag
+explanation_cache = ExplanationCache()
+
+# Risk explanation batching: rough prompt-token budget per request,
+# how many batches are in flight at once, and retries per failed batch.
+EXPLAIN_BATCH_TOKENS = int(os.getenv("EXPLAIN_BATCH_TOKENS", "3000"))
+EXPLAIN_CONCURRENCY = int(os.getenv("EXPLAIN_CONCURRENCY", "4"))
+EXPLAIN_RETRIES = int(os.getenv("EXPLAIN_RETRIES", "2"))
+
 FALLBACK_CHAIN = [
     "gemini-2.5-flash",
     "gemini-2.5-flash-lite",
@@ -23,43 +39,54 @@ FALLBACK_CHAIN = [
     "gemma-3-1b"
 ]
 
+# Remembers per-model failures/latency; skips models whose circuit is open
+router = ModelRouter(FALLBACK_CHAIN)
+
+
+def _generate(model_name, prompt, response_mime_type):
+    print(f"🤖 Attempting {model_name}...")
+    response = client.models.generate_content(
+        model=model_name,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type=response_mime_type,
+            temperature=0.2
+        )
+    )
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.inc("bsef_llm_tokens_total", usage.prompt_token_count or 0, model=model_name, kind="prompt")
+        metrics.inc("bsef_llm_tokens_total", usage.candidates_token_count or 0, model=model_name, kind="completion")
+    return response.text
+
 
 def _query_llm_with_fallback(prompt, response_mime_type="application/json"):
-    """Internal helper to run the fallback chain."""
+    """Internal helper: routes the call to the healthiest model in the fallback chain."""
     if not client:
         return None
 
-    for model_name in FALLBACK_CHAIN:
-        try:
-            print(f"🤖 Attempting {model_name}...")
-            response = client.models.generate_content(
-                model=model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type=response_mime_type,
-                    temperature=0.2
-                )
-            )
-            return response.text
-        except Exception as e:
-            print(f"⚠️ {model_name} failed: {e}")
-            continue
-    return None
-
-
-def generate_batch_summary(risk_rows: pd.DataFrame) -> str:
+    _, text = router.call(lambda model_name: _generate(model_name, prompt, response_mime_type))
+    return text
+
+
+def generate_batch_summary(risk_rows: pd.DataFrame, rollup: dict = None) -> str:
     """
     Generates a text summary and action plan for the entire dataset.
+    The prompt is built from the scan rollup (see rollups.py): severity
+    totals, the largest exposure segments and the top risks by score.
     """
     if risk_rows.empty:
         return "No risks to summarize."
 
-    # Summarize data for prompt (limit to top 10 to save tokens)
-    top_risks = risk_rows.head(10).to_dict(orient="records")
+    if rollup is None:
+        rollup = build_rollup(risk_rows)
 
     prompt = f"""
     You are a Lead Financial Auditor. 
-    Review these high-risk transactions: {top_risks}
+    Scan totals: {rollup["anomalies"]} risks out of {rollup["total_transactions"]} transactions, exposure ${rollup["risk_value"]:,.2f}.
+    Exposure by severity: {json.dumps(rollup["by_severity"])}
+    Largest exposure segments (vendor / GL / month / severity): {json.dumps(rollup["segments"][:5], default=str)}
+    Highest-risk transactions: {json.dumps(rollup["top_exposures"], default=str)}
 
     Write an Executive Audit Summary (plain text, no markdown **bolding**).
     Include:
@@ -74,8 +101,73 @@ def generate_batch_summary(risk_rows: pd.DataFrame) -> str:
     return response if response else "Audit summary generation failed."
 
 
+def _estimate_tokens(text: str) -> int:
+    """~4 characters per token; good enough to keep prompts under the limit."""
+    return len(text) // 4 + 1
+
+
+def _token_batches(transactions: list, budget: int = EXPLAIN_BATCH_TOKENS) -> list:
+    """Greedily packs transactions into batches whose payload fits the token budget."""
+    batches, current, used = [], [], 0
+    for t in transactions:
+        cost = _estimate_tokens(json.dumps(t, default=str))
+        if current and used + cost > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(t)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _request_explanations(transactions: list) -> dict:
+    """One model call for one batch. Returns {} on a failed or unparseable response."""
+    prompt = f"""
+    Analyze these transactions: {json.dumps(transactions, default=str)}
+    For EACH "id", return a JSON object: {{ "id": "Short explanation" }}
+    """
+
+    response = _query_llm_with_fallback(prompt, response_mime_type="application/json")
+    try:
+        parsed = json.loads(response) if response else {}
+    except json.JSONDecodeError:
+        print(f"⚠️ Unparseable response for a batch of {len(transactions)} (likely truncated)")
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _explain_batch(batch: list, retries: int = EXPLAIN_RETRIES) -> dict:
+    """Explains one batch; ids missing from a response are retried on their own."""
+    explanations = {}
+    pending = batch
+    for attempt in range(retries + 1):
+        generated = _request_explanations(pending)
+        explanations.update({t["id"]: str(generated[t["id"]]) for t in pending if t["id"] in generated})
+        pending = [t for t in pending if t["id"] not in explanations]
+        if not pending:
+            break
+        if attempt < retries:
+            print(f"🔁 Retrying {len(pending)} unexplained transactions (attempt {attempt + 2})...")
+    return explanations
+
+
+def _explain_transactions(transactions: list) -> dict:
+    """Token-bounded batches, sent concurrently and merged by id."""
+    batches = _token_batches(transactions)
+    if len(batches) == 1:
+        return _explain_batch(batches[0])
+
+    print(f"📦 Explaining {len(transactions)} transactions in {len(batches)} batches...")
+    merged = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(EXPLAIN_CONCURRENCY, len(batches)))) as pool:
+        for result in pool.map(_explain_batch, batches):
+            merged.update(result)
+    return merged
+
+
 def batch_analyze_risks(risk_rows: pd.DataFrame) -> dict:
-    """Row-by-row analysis returning JSON."""
+    """Row-by-row analysis returning JSON. Only cache misses are sent to the model."""
     if risk_rows.empty:
         return {}
 
@@ -88,32 +180,62 @@ def batch_analyze_risks(risk_rows: pd.DataFrame) -> dict:
             "flag": row.get("anomaly_reason")
         })
 
-    prompt = f"""
-    Analyze these transactions: {json.dumps(transactions)}
-    For EACH "id", return a JSON object: {{ "id": "Short explanation" }}
-    """
+    keys = {t["id"]: explanation_key(t["vendor"], t["amount"], t["flag"]) for t in transactions}
+    cached = explanation_cache.get_many(keys.values())
+    explanations = {tx_id: cached[key] for tx_id, key in keys.items() if key in cached}
 
-    response = _query_llm_with_fallback(prompt, response_mime_type="application/json")
-    try:
-        return json.loads(response) if response else {}
-    except:
-        return {}
+    # One representative per distinct fingerprint among the misses
+    misses = {}
+    for t in transactions:
+        key = keys[t["id"]]
+        if key not in cached and key not in misses:
+            misses[key] = t
+
+    print(f"💾 Explanation cache: {len(explanations)} cached, {len(misses)} to generate")
+    metrics.inc("bsef_explanations_total", len(explanations), tier="cache")
+    if not misses:
+        return explanations
+
+    generated = _explain_transactions(list(misses.values()))
+
+    fresh = {}
+    for key, t in misses.items():
+        if t["id"] in generated:
+            fresh[key] = str(generated[t["id"]])
+    explanation_cache.put_many(fresh)
+    metrics.inc("bsef_explanations_total", len(fresh), tier="llm")
 
+    for tx_id, key in keys.items():
+        if key in fresh:
+            explanations[tx_id] = fresh[key]
+    return explanations
 
-def explain_anomalies(df: pd.DataFrame) -> pd.DataFrame:
-    """Enriches DataFrame with row-by-row explanations."""
+
+def explain_anomalies(df: pd.DataFrame, typical: pd.Series = None, use_templates: bool = True) -> pd.DataFrame:
+    """
+    Enriches DataFrame with row-by-row explanations. Known single-reason
+    flags get a local template note (see explanation_templates.py); only
+    combined or unrecognised reasons are sent to the LLM. `typical` (by
+    index) is the mean each row was scored against (AnomalyModel.reference_means).
+    """
     df = df.copy()
     if "status" not in df.columns: return df
 
     risk_rows = df[df["status"] == "Risk"]
     if risk_rows.empty: return df
 
-    print(f"🔍 Analyzing {len(risk_rows)} risks...")
-    explanations = batch_analyze_risks(risk_rows)
+    local = local_explanations(risk_rows, typical) if use_templates else {}
+    metrics.inc("bsef_explanations_total", len(local), tier="local")
+    escalated = risk_rows[~risk_rows.index.astype(str).isin(list(local))] if local else risk_rows
+
+    print(f"🔍 Analyzing {len(risk_rows)} risks ({len(local)} local, {len(escalated)} to the LLM)...")
+    explanations = batch_analyze_risks(escalated) if not escalated.empty else {}
 
-    for idx, row in df.iterrows():
-        idx_str = str(idx)
-        if idx_str in explanations:
-            df.at[idx, "anomaly_reason"] = f"🤖 {explanations[idx_str]}"
+    notes = {**{k: f"{LOCAL_NOTE_PREFIX} {v}" for k, v in local.items()},
+             **{k: f"🤖 {v}" for k, v in explanations.items()}}
+    if notes:
+        labels = df.index.astype(str)
+        has_note = labels.isin(list(notes))
+        df.loc[has_note, "anomaly_reason"] = [notes[label] for label in labels[has_note]]
 
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metrics import metrics
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+LLM_COOLDOWN_S = float(os.getenv("LLM_COOLDOWN_S", "60"))
+# Attempt threads; sized above the callers (2 job workers x 4 bulk ledgers x 4 explain batches, plus /scan)
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "64"))
+
+
+class ModelHealth:
+    """Rolling health of one model: circuit state, failures and latency."""
+
+    def __init__(self, name: str, position: int):
+        self.name = name
+        self.position = position  # preference order in the fallback chain
+        self.state = "closed"  # closed -> open (after repeated failures) -> half_open (probe) -> closed
+        self.probing = False  # a caller has claimed the half-open probe
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_failure_at = None
+        self.latency_ewma = None
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+        }
+
+
+class ModelRouter:
+    """
+    Health-aware replacement for walking the fallback chain top to bottom.
+      - A model that fails `failure_threshold` times in a row has its circuit
+        opened and is skipped for `cooldown_s`.
+      - After the cooldown it gets one probe call (half-open): the first
+        caller claims it, others skip the model until the probe resolves;
+        success closes the circuit, failure re-opens it.
+      - Each call starts at the healthiest model: fewest recent failures
+        (failures older than the cooldown are forgiven), then not-slow, then
+        chain preference.
+      - Every attempt is bounded by `timeout_s`, counted from when it starts
+        running; time queued behind other attempts is not the model's fault.
+    `call_model(model_name)` does the actual request, so any client (or a
+    local fake in tests) can sit behind the router.
+    """
+
+    def __init__(self, models, failure_threshold: int = LLM_FAILURE_THRESHOLD, cooldown_s: float = LLM_COOLDOWN_S,
+                 timeout_s: float = LLM_TIMEOUT_S, clock=time.monotonic, ewma_alpha: float = 0.3,
+                 max_workers: int = LLM_MAX_INFLIGHT):
+        self.health = {name: ModelHealth(name, i) for i, name in enumerate(models)}
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.timeout_s = timeout_s
+        self.clock = clock
+        self.ewma_alpha = ewma_alpha
+        self.fallbacks = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+        # Attempts run here so a hung request can be abandoned at the timeout
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+
+    def _claim_order(self):
+        """
+        Models to try for the next call: (ready, probes). Closed models best
+        first; open circuits are skipped; half-open models are claimed for this
+        caller, who must resolve the probe (_record_*) or hand it back
+        (_release_probes).
+        """
+        now = self.clock()
+        ready, probes = [], []
+        with self._lock:
+            for h in self.health.values():
+                if h.state == "open" and now - h.opened_at >= self.cooldown_s:
+                    h.state = "half_open"
+                if h.state == "closed":
+                    ready.append(h)
+                elif h.state == "half_open" and not h.probing:
+                    h.probing = True
+                    probes.append(h)
+
+            def recent_failures(h):
+                if h.last_failure_at is None or now - h.last_failure_at >= self.cooldown_s:
+                    return 0
+                return h.consecutive_failures
+
+            slow = self.timeout_s / 2
+            ready.sort(key=lambda h: (
+                recent_failures(h),
+                h.latency_ewma is not None and h.latency_ewma > slow,
+                h.position,
+            ))
+            probes.sort(key=lambda h: h.position)
+        return [h.name for h in ready], [h.name for h in probes]
+
+    def _release_probes(self, names):
+        """Hands back probes claimed by _claim_order() but never attempted."""
+        with self._lock:
+            for name in names:
+                self.health[name].probing = False
+
+    def _record_success(self, name: str, latency: float):
+        with self._lock:
+            h = self.health[name]
+            h.probing = False
+            h.calls += 1
+            h.consecutive_failures = 0
+            h.state, h.opened_at = "closed", None
+            h.latency_ewma = latency if h.latency_ewma is None else (
+                self.ewma_alpha * latency + (1 - self.ewma_alpha) * h.latency_ewma
+            )
+
+    def _record_failure(self, name: str, timed_out: bool):
+        with self._lock:
+            h = self.health[name]
+            h.probing = False
+            h.calls += 1
+            h.failures += 1
+            h.timeouts += int(timed_out)
+            h.consecutive_failures += 1
+            h.last_failure_at = self.clock()
+            if h.state == "half_open" or h.consecutive_failures >= self.failure_threshold:
+                h.state, h.opened_at = "open", self.clock()
+
+    def call(self, call_model):
+        """Returns (model_name, result) from the first model that answers, or (None, None)."""
+        ready, probes = self._claim_order()
+        names = ready + probes
+        tried = 0
+        try:
+            for attempt, name in enumerate(names):
+                tried += 1
+                started = threading.Event()
+                start = None
+
+                def run(name=name):
+                    nonlocal start
+                    start = self.clock()
+                    started.set()
+                    return call_model(name)
+
+                future = self._executor.submit(run)
+                if not started.wait(self.timeout_s) and future.cancel():
+                    # Every attempt thread is busy; not this model's fault, so its health is untouched
+                    print(f"⏳ {name} not attempted: all {self.max_workers} LLM call slots busy")
+                    metrics.observe("bsef_llm_request_seconds", 0.0, model=name, outcome="queued")
+                    if name in probes:
+                        self._release_probes([name])
+                    continue
+                started.wait()  # running (or cancel() lost the race to start it)
+                try:
+                    result = future.result(timeout=self.timeout_s)
+                except FutureTimeout:
+                    future.cancel()
+                    print(f"⏱️ {name} timed out after {self.timeout_s}s")
+                    self._record_failure(name, timed_out=True)
+                    metrics.observe("bsef_llm_request_seconds", self.clock() - start, model=name, outcome="timeout")
+                    continue
+                except Exception as e:
+                    print(f"⚠️ {name} failed: {e}")
+                    self._record_failure(name, timed_out=False)
+                    metrics.observe("bsef_llm_request_seconds", self.clock() - start, model=name, outcome="error")
+                    continue
+
+                latency = self.clock() - start
+                self._record_success(name, latency)
+                metrics.observe("bsef_llm_request_seconds", latency, model=name, outcome="ok")
+                if attempt > 0:
+                    with self._lock:
+                        self.fallbacks += 1
+                    metrics.inc("bsef_llm_fallbacks_total")
+                return name, result
+        finally:
+            # Probes behind the model that answered were never tried
+            self._release_probes([name for name in names[tried:] if name in probes])
+
+        with self._lock:
+            self.exhausted += 1
+        metrics.inc("bsef_llm_exhausted_total")
+        return None, None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "fallbacks": self.fallbacks,
+                "exhausted": self.exhausted,
+                "models": [h.to_dict() for h in sorted(self.health.values(), key=lambda h: h.position)],
+            }
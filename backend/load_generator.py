@@ -0,0 +1,202 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Anomaly types the generator can inject, each matching one AnomalyModel rule
+ANOMALY_TYPES = ["spike", "new_vendor", "new_gl", "unusual_type"]
+
+TRANSACTION_TYPES = ["Invoice", "Credit Memo", "Payment"]
+UNUSUAL_TYPE = "Journal"  # never used by normal rows
+
+
+class LedgerSpec:
+    """
+    Shape of a synthetic load-test ledger. Amounts are log-normal per
+    vendor x GL x cost center segment (median = product of per-entity
+    scales drawn between `amount_median_range`). Anomalies are only
+    injected into the last `anomaly_months` months, at `anomaly_rates`
+    (fraction of rows per type), and labelled in `is_anomaly` / `anomaly_type`.
+    """
+
+    def __init__(self, months: int = 12, rows_per_month: int = 100_000, start_month: str = "2025-01",
+                 vendors: int = 500, gl_codes: int = 80, cost_centers: int = 30,
+                 amount_median_range=(200.0, 20_000.0), amount_sigma: float = 0.25,
+                 anomaly_rates: dict = None, anomaly_months: int = 1, spike_factor_range=(8.0, 25.0),
+                 chunk_rows: int = 250_000, seed: int = 0):
+        self.months = months
+        self.rows_per_month = rows_per_month
+        self.start_month = start_month
+        self.vendors = vendors
+        self.gl_codes = gl_codes
+        self.cost_centers = cost_centers
+        self.amount_median_range = amount_median_range
+        self.amount_sigma = amount_sigma
+        self.anomaly_rates = {"spike": 0.002, "new_vendor": 0.0005, "new_gl": 0.0005, "unusual_type": 0.001}
+        self.anomaly_rates.update(anomaly_rates or {})
+        unknown = set(self.anomaly_rates) - set(ANOMALY_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown anomaly types: {sorted(unknown)}")
+        self.anomaly_months = anomaly_months
+        self.spike_factor_range = spike_factor_range
+        self.chunk_rows = chunk_rows
+        self.seed = seed
+
+    @property
+    def total_rows(self) -> int:
+        return self.months * self.rows_per_month
+
+
+class _Entities:
+    """Per-entity names, amount scales and each vendor's usual transaction type."""
+
+    def __init__(self, spec: LedgerSpec, rng: np.random.Generator):
+        self.vendor_names = np.array([f"Vendor {i:05d}" for i in range(spec.vendors)], dtype=object)
+        self.gl_codes = np.arange(5000, 5000 + spec.gl_codes)
+        self.cost_center_names = np.array([f"CC{i:03d}" for i in range(spec.cost_centers)], dtype=object)
+
+        # Per-entity log scales; a segment's log median is their sum
+        low, high = np.log(spec.amount_median_range)
+        width = (high - low) / 3
+        self.vendor_log = rng.uniform(low / 3, low / 3 + width, spec.vendors)
+        self.gl_log = rng.uniform(low / 3, low / 3 + width, spec.gl_codes)
+        self.cc_log = rng.uniform(low / 3, low / 3 + width, spec.cost_centers)
+
+        # Skewed popularity, like a real vendor master
+        self.vendor_p = _zipf_weights(spec.vendors)
+        self.gl_p = _zipf_weights(spec.gl_codes)
+        self.cc_p = _zipf_weights(spec.cost_centers)
+
+        self.vendor_type = rng.choice(len(TRANSACTION_TYPES), spec.vendors, p=[0.8, 0.1, 0.1])
+
+
+def _zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _month_labels(spec: LedgerSpec) -> list:
+    return [str(p) for p in pd.period_range(spec.start_month, periods=spec.months, freq="M")]
+
+
+def _generate_chunk(spec: LedgerSpec, ent: _Entities, rng: np.random.Generator, month: str,
+                    rows: int, first_id: int, inject: bool, next_new: dict) -> pd.DataFrame:
+    vendor = rng.choice(spec.vendors, rows, p=ent.vendor_p)
+    gl = rng.choice(spec.gl_codes, rows, p=ent.gl_p)
+    cc = rng.choice(spec.cost_centers, rows, p=ent.cc_p)
+
+    log_median = ent.vendor_log[vendor] + ent.gl_log[gl] + ent.cc_log[cc]
+    amount = np.round(np.exp(log_median + rng.normal(0.0, spec.amount_sigma, rows)), 2)
+
+    days = rng.integers(0, 28, rows).astype("timedelta64[D]")
+    date = np.datetime64(month, "D") + days
+
+    vendor_names = ent.vendor_names[vendor]
+    gl_codes = ent.gl_codes[gl]
+    types = np.array(TRANSACTION_TYPES, dtype=object)[ent.vendor_type[vendor]]
+    anomaly_type = np.full(rows, "", dtype=object)
+
+    if inject:
+        # Each row gets at most one injected anomaly type
+        draw = rng.random(rows)
+        edge = 0.0
+        for kind in ANOMALY_TYPES:
+            rate = spec.anomaly_rates.get(kind, 0.0)
+            mask = (draw >= edge) & (draw < edge + rate)
+            edge += rate
+            count = int(mask.sum())
+            if not count:
+                continue
+            anomaly_type[mask] = kind
+            if kind == "spike":
+                amount[mask] = np.round(amount[mask] * rng.uniform(*spec.spike_factor_range, count), 2)
+            elif kind == "new_vendor":
+                ids = np.arange(next_new["vendor"], next_new["vendor"] + count)
+                next_new["vendor"] += count
+                vendor_names[mask] = [f"New Vendor {i:06d}" for i in ids]
+            elif kind == "new_gl":
+                gl_codes[mask] = np.arange(next_new["gl"], next_new["gl"] + count)
+                next_new["gl"] += count
+            elif kind == "unusual_type":
+                types[mask] = UNUSUAL_TYPE
+
+    return pd.DataFrame({
+        "id": np.arange(first_id, first_id + rows),
+        "date": date,
+        "vendor": vendor_names,
+        "gl_code": gl_codes,
+        "cost_center": ent.cost_center_names[cc],
+        "transaction_type": types,
+        "amount": amount,
+        "is_anomaly": anomaly_type != "",
+        "anomaly_type": anomaly_type,
+    })
+
+
+def iter_ledger_chunks(spec: LedgerSpec = None):
+    """Yields the ledger month by month in frames of at most `spec.chunk_rows` rows."""
+    spec = spec or LedgerSpec()
+    rng = np.random.default_rng(spec.seed)
+    ent = _Entities(spec, rng)
+    # New entities never collide with the master data
+    next_new = {"vendor": 1, "gl": 90_000}
+
+    next_id = 1
+    months = _month_labels(spec)
+    for i, month in enumerate(months):
+        inject = i >= len(months) - spec.anomaly_months
+        for start in range(0, spec.rows_per_month, spec.chunk_rows):
+            rows = min(spec.chunk_rows, spec.rows_per_month - start)
+            yield _generate_chunk(spec, ent, rng, month, rows, next_id, inject, next_new)
+            next_id += rows
+
+
+def write_ledger(path: str, spec: LedgerSpec = None, labels: bool = True) -> dict:
+    """
+    Streams a synthetic ledger to `path` (.parquet or .csv) chunk by chunk.
+    `labels=False` drops the ground-truth columns. Returns row and per-type
+    anomaly counts.
+    """
+    spec = spec or LedgerSpec()
+    is_parquet = path.endswith(".parquet")
+    if not is_parquet and not path.endswith(".csv"):
+        raise ValueError(f"Unsupported output format: {path} (use .parquet or .csv)")
+
+    summary = {"rows": 0, "anomalies": {kind: 0 for kind in ANOMALY_TYPES}}
+    writer, header = None, True
+    try:
+        for chunk in iter_ledger_chunks(spec):
+            summary["rows"] += len(chunk)
+            for kind, count in chunk["anomaly_type"][chunk["is_anomaly"]].value_counts().items():
+                summary["anomalies"][kind] += int(count)
+            if not labels:
+                chunk = chunk.drop(columns=["is_anomaly", "anomaly_type"])
+
+            if is_parquet:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode="w" if header else "a", header=header, index=False, date_format="%Y-%m-%d")
+                header = False
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return summary
+
+
+if __name__ == "__main__":
+    # python load_generator.py ledger.parquet [rows_per_month] [months]
+    out = sys.argv[1] if len(sys.argv) > 1 else "load_ledger.parquet"
+    spec = LedgerSpec(
+        rows_per_month=int(sys.argv[2]) if len(sys.argv) > 2 else 100_000,
+        months=int(sys.argv[3]) if len(sys.argv) > 3 else 12,
+        seed=int(os.getenv("LOAD_GEN_SEED", "0")),
+    )
+    result = write_ledger(out, spec)
+    print(f"✅ Created '{out}' with {result['rows']} rows, anomalies: {result['anomalies']}")
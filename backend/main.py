@@ -1,17 +1,33 @@
 from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 import pandas as pd
-import io
+import os
 import base64
 import json
+import tempfile
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import your modules
 from generator import generate_synthetic_ledger
 from model import AnomalyModel
-from llm_explainer import explain_anomalies, generate_batch_summary
-from data_ingestion import ingest_dataframe
+from llm_explainer import explain_anomalies, generate_batch_summary, explanation_cache, router as llm_router
+from data_ingestion import ingest_dataframe, read_ledger_csv
 from pdf_generator import create_audit_pdf
+from baseline import BaselineIndex, BaselineStore
+from isolation_forest import IsolationForestLayer
+from duplicates import DuplicatePaymentLayer
+from out_of_core import scan_csv_out_of_core
+from ledger_cache import LedgerCache
+from jobs import JobQueue
+from rollups import build_rollup
+from sessions import ScanSessionStore
+from result_formats import RESULT_FORMATS, result_response, select_rows
+from parallel_scan import BASELINE_MODES, PARTITION_KEYS, scan_partitioned
+from metrics import metrics, profiler, request_timings, server_timing, stage
 
 # --- THIS WAS LIKELY MISSING ---
 app = FastAPI()
@@ -24,84 +40,794 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the Hybrid Model
-model = AnomalyModel()
+# Server-Timing header with per-stage durations: always when TIMING_HEADERS=1,
+# otherwise only for requests sending "X-Timing: 1".
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
 
 
-@app.get("/scan")
-def get_scan_results(use_fake: bool = True, use_llm: bool = True):
-    if use_fake:
-        print("DEBUG: Generating Synthetic Data...")
-        df = generate_synthetic_ledger()
-    else:
-        return {"error": "Use POST for real data"}
+@app.middleware("http")
+async def timing_headers(request: Request, call_next):
+    if not (TIMING_HEADERS or request.headers.get("X-Timing") == "1"):
+        return await call_next(request)
 
+    timings = {}
+    token = request_timings.set(timings)
     try:
-        # 1. Ingest
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    if timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+# Initialize the Hybrid Model (Z-Score rules + duplicate payments + Isolation Forest, fitted once per baseline)
+isolation_forest = IsolationForestLayer()
+duplicates = DuplicatePaymentLayer()
+model = AnomalyModel(isolation_forest=isolation_forest, duplicates=duplicates)
+# Same engine, z-scores measured against vendor x GL x cost center baselines
+segment_model = AnomalyModel(zscore_mode="segment", isolation_forest=isolation_forest, duplicates=duplicates)
+
+# Closed-month baseline snapshots (see baseline.py)
+baseline_store = BaselineStore()
+
+# Normalized ledgers keyed by upload content hash (see ledger_cache.py)
+ledger_cache = LedgerCache()
+
+# Bounded pool for background scans (SCAN_JOB_WORKERS, see jobs.py)
+job_queue = JobQueue()
+
+# Scored ledgers kept server-side by scan id (SCAN_SESSION_TTL_S / _MAX_MB, see sessions.py)
+scan_sessions = ScanSessionStore()
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Bulk close-day scans: ledgers per request, and how many are scanned at once within the job
+BULK_MAX_LEDGERS = int(os.getenv("BULK_MAX_LEDGERS", "100"))
+# Total uncompressed size of the CSVs in a request's zips, checked before extracting
+BULK_MAX_UNZIPPED_MB = float(os.getenv("BULK_MAX_UNZIPPED_MB", "4096"))
+BULK_SCAN_WORKERS = int(os.getenv("BULK_SCAN_WORKERS", "4"))
+
+
+def _service_gauges():
+    """Point-in-time gauges for /metrics: sessions, jobs, explanation cache, circuits."""
+    sessions = scan_sessions.snapshot()
+    cache = explanation_cache.snapshot()
+    gauges = [
+        ("bsef_scan_sessions", "Live scan sessions.", {}, sessions["sessions"]),
+        ("bsef_scan_sessions_mb", "Memory held by scan sessions (MB).", {}, sessions["size_mb"]),
+        ("bsef_explanation_cache_hit_rate", "Hit rate of the LLM explanation cache.", {}, cache["hit_rate"]),
+    ]
+    for status, count in job_queue.counts().items():
+        gauges.append(("bsef_jobs", "Background jobs by status.", {"status": status}, count))
+    for h in llm_router.snapshot()["models"]:
+        gauges.append(("bsef_llm_circuit_open", "1 while the model's circuit is open.", {"model": h["model"]},
+                       int(h["state"] == "open")))
+    return gauges
+
+
+metrics.register_collector(_service_gauges)
+
+
+async def spool_upload(file: UploadFile, suffix: str = ".csv"):
+    """
+    Copies an upload to a temp file on disk chunk by chunk, so the raw bytes
+    are never held in memory next to the parsed frame. Returns the path and
+    the SHA-256 of the content (hashed on the way through). Caller deletes the file.
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    return tmp.name, digest.hexdigest()
+
+
+def _zip_csv_members(archive: zipfile.ZipFile) -> list:
+    return [info for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith(".csv")]
+
+
+def _spool_zip_members(zip_path: str, max_members: int, max_bytes: float) -> list:
+    """
+    Extracts every CSV in a zip to its own temp file (same contract as
+    spool_upload): [(name, path, hash)]. The member count and declared
+    uncompressed size are checked against the limits before anything is
+    extracted; on any error the files written so far are removed.
+    """
+    spooled = []
+    with zipfile.ZipFile(zip_path) as archive:
+        members = _zip_csv_members(archive)
+        if len(members) > max_members:
+            raise ValueError(f"Too many ledgers: the upload holds more than {BULK_MAX_LEDGERS}")
+        if sum(info.file_size for info in members) > max_bytes:
+            raise ValueError(f"Zipped ledgers exceed {BULK_MAX_UNZIPPED_MB:g} MB uncompressed")
+        try:
+            for info in members:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
+                    spooled.append((os.path.basename(info.filename), tmp.name, None))
+                    digest = hashlib.sha256()
+                    # ZipExtFile stops at the declared file_size, so the check above bounds the disk use
+                    with archive.open(info) as src:
+                        while True:
+                            chunk = src.read(UPLOAD_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            digest.update(chunk)
+                            tmp.write(chunk)
+                spooled[-1] = (spooled[-1][0], tmp.name, digest.hexdigest())
+        except BaseException:
+            _remove_files([path for _, path, _ in spooled])
+            raise
+    return spooled
+
+
+async def spool_bulk_uploads(files: list) -> list:
+    """
+    Spools several uploads (CSV files and / or zips of CSVs) to disk.
+    Returns [(ledger name, path, hash)]; names are made unique. Caller deletes the files.
+    Raises ValueError past BULK_MAX_LEDGERS ledgers or BULK_MAX_UNZIPPED_MB of
+    zipped CSVs; nothing stays on disk when it raises.
+    """
+    spooled = []
+    unzipped_budget = BULK_MAX_UNZIPPED_MB * 1024 ** 2
+    try:
+        for file in files:
+            name = file.filename or "ledger.csv"
+            if name.lower().endswith(".zip"):
+                zip_path, _ = await spool_upload(file, suffix=".zip")
+                try:
+                    members = await run_in_threadpool(_spool_zip_members, zip_path,
+                                                      BULK_MAX_LEDGERS - len(spooled), unzipped_budget)
+                finally:
+                    os.remove(zip_path)
+                spooled.extend(members)
+                unzipped_budget -= sum(os.path.getsize(path) for _, path, _ in members)
+            else:
+                if len(spooled) >= BULK_MAX_LEDGERS:
+                    raise ValueError(f"Too many ledgers: the upload holds more than {BULK_MAX_LEDGERS}")
+                path, content_hash = await spool_upload(file)
+                spooled.append((os.path.basename(name), path, content_hash))
+    except BaseException:
+        _remove_files([path for _, path, _ in spooled])
+        raise
+
+    seen, ledgers = {}, []
+    for name, path, content_hash in spooled:
+        seen[name] = seen.get(name, 0) + 1
+        ledgers.append((name if seen[name] == 1 else f"{name}#{seen[name]}", path, content_hash))
+    return ledgers
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_spooled_ledger(path: str, content_hash: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Ingested ledger for a spooled upload. Exports seen before are memory-mapped
+    from the columnar ledger cache, skipping parse + ingest.
+    """
+    if use_cache:
+        cached = ledger_cache.load(content_hash)
+        if cached is not None:
+            return cached
+
+    df = ingest_dataframe(read_ledger_csv(path), report_memory=True)
+    if use_cache:
+        ledger_cache.save(content_hash, df)
+    return df
+
+
+async def load_ledger(file: UploadFile, use_cache: bool = True) -> pd.DataFrame:
+    """Spools the upload and returns the ingested ledger (parsed off the event loop)."""
+    path, content_hash = await spool_upload(file)
+    try:
+        return await run_in_threadpool(load_spooled_ledger, path, content_hash, use_cache)
+    finally:
+        os.remove(path)
+
+
+def _ml_layer_status(detector: AnomalyModel, baseline: BaselineIndex) -> str:
+    """
+    "applied", or "skipped" when no forest exists for the baseline: it is
+    only trained from an upload holding exactly the baseline's history, so an
+    extended baseline, or a stored one scanned with a current-month-only
+    upload, has none until such an upload is scanned.
+    """
+    if detector.isolation_forest.has_model(baseline.fingerprint):
+        return "applied"
+    print(f"⚠️ Isolation Forest skipped: no forest for baseline {baseline.fingerprint} "
+          f"and the upload does not hold its full history")
+    return "skipped"
+
+
+def _report(job, stage: str, progress: float):
+    if job is not None:
+        job.update(stage, progress)
+
+
+@profiler.profiled("scan:upload")
+def scan_spooled_upload(path: str, content_hash: str, detector: AnomalyModel, baseline_id: str = None,
+                        use_llm: bool = True, out_of_core: bool = False, use_ledger_cache: bool = True,
+                        partition_by: str = None, partition_baseline: str = "shared",
+                        baseline: BaselineIndex = None, job=None):
+    """
+    Full scan pipeline for a spooled upload. Blocking: runs in a worker thread,
+    either for POST /scan or as a background job. Returns (df, meta).
+    With `partition_by`, detection runs in a process pool (see parallel_scan.py).
+    `baseline` passes an already loaded baseline (bulk scans load it once).
+    """
+    meta = {}
+    if baseline is None and baseline_id:
+        baseline = baseline_store.load(baseline_id)
+
+    if out_of_core:
+        # 1+2. Ingest & detect chunk by chunk
+        _report(job, "detect", 0.1)
+        risks_path = f"{path}.risks.csv"
+        try:
+            with stage("ingest+detect") as span:
+                summary = scan_csv_out_of_core(path, risks_path, detector, baseline=baseline,
+                                               on_chunk=lambda rows: _report(job, "detect", 0.1))
+                span["rows"] = summary["rows"]
+            df = pd.read_csv(risks_path) if summary["flagged"] else pd.DataFrame()
+        finally:
+            if os.path.exists(risks_path):
+                os.remove(risks_path)
+        meta["rows_scanned"] = summary["rows"]
+        if baseline is None:
+            baseline = summary["baseline"]
+            if baseline is not None:
+                baseline_store.save(baseline)
+    else:
+        # 1. Ingest (or reuse the cached columnar copy of this exact export)
+        _report(job, "ingest", 0.1)
+        with stage("ingest") as span:
+            df = load_spooled_ledger(path, content_hash, use_cache=use_ledger_cache)
+            span["rows"] = len(df)
+
+        # 2. Detect (reuse a stored baseline, or build + persist one from this upload).
+        # The Isolation Forest is cached under the same baseline fingerprint.
+        _report(job, "detect", 0.4)
+        with stage("detect", rows=len(df)):
+            if baseline is None:
+                baseline = detector.build_baseline(df)
+                if baseline is not None:
+                    baseline_store.save(baseline)
+
+            if partition_by:
+                df = scan_partitioned(df, detector, partition_by=partition_by, baseline=baseline,
+                                      baseline_mode=partition_baseline)
+            else:
+                df = detector.detect_anomalies(df, baseline=baseline)
+
+    if baseline is not None:
+        meta["baseline_id"] = baseline.fingerprint
+        if detector.isolation_forest is not None:
+            meta["ml_layer"] = _ml_layer_status(detector, baseline)
+
+    # 3. Explain (local templates first, LLM for the rest)
+    if use_llm:
+        _report(job, "explain", 0.7)
+        with stage("explain", rows=len(df)):
+            typical = None
+            # Per-partition baselines stay in the workers; their notes omit the "typical" amount
+            if baseline is not None and not (partition_by and partition_baseline == "partition"):
+                risks = df[df["status"] == "Risk"]
+                typical = detector.reference_means(risks, baseline)
+            df = explain_anomalies(df, typical=typical)
+
+    return df, meta
+
+
+@profiler.profiled("scan:synthetic")
+def scan_synthetic(use_llm: bool = True, job=None) -> pd.DataFrame:
+    with stage("generate") as span:
+        df = generate_synthetic_ledger()
+        span["rows"] = len(df)
+
+    # 1. Ingest
+    _report(job, "ingest", 0.1)
+    with stage("ingest", rows=len(df)):
         df = ingest_dataframe(df)
 
-        # 2. Detect (Stats + ML Isolation Forest)
+    # 2. Detect (Stats + ML Isolation Forest)
+    _report(job, "detect", 0.4)
+    with stage("detect", rows=len(df)):
         df = model.detect_anomalies(df)
 
-        # 3. Explain (LLM)
-        if use_llm:
+    # 3. Explain (LLM)
+    if use_llm:
+        _report(job, "explain", 0.7)
+        with stage("explain", rows=len(df)):
             df = explain_anomalies(df)
 
-        df = df.fillna("")
-        return df.to_dict(orient="records")
+    return df
+
+
+def store_scan(df: pd.DataFrame, meta: dict, job=None) -> dict:
+    """Rolls up a finished scan and keeps it as a session; adds `scan_id` to meta. Returns the rollup."""
+    _report(job, "rollup", 0.9)
+    with stage("rollup", rows=len(df)):
+        rollup = build_rollup(df, total_rows=meta.get("rows_scanned"))
+    meta["scan_id"] = scan_sessions.put(df, rollup, meta)
+    return rollup
+
+
+def _meta_headers(meta: dict) -> dict:
+    headers = {}
+    if "scan_id" in meta:
+        headers["X-Scan-Id"] = meta["scan_id"]
+    if "baseline_id" in meta:
+        headers["X-Baseline-Id"] = meta["baseline_id"]
+    if "rows_scanned" in meta:
+        headers["X-Rows-Scanned"] = str(meta["rows_scanned"])
+    if "ml_layer" in meta:
+        headers["X-ML-Layer"] = meta["ml_layer"]
+    return headers
+
+
+def rows_response(df: pd.DataFrame, meta: dict, risks_only: bool = False, offset: int = 0, limit: int = None,
+                  format: str = "json"):
+    """
+    Scan rows in the requested shape: everything or `risks_only`, optionally
+    paged by risk_score (`offset`/`limit`, total in X-Total-Rows), as a JSON
+    list, streamed NDJSON, Arrow IPC or Parquet.
+    """
+    rows, total = select_rows(df, risks_only=risks_only, offset=offset, limit=limit)
+    headers = {**_meta_headers(meta), "X-Total-Rows": str(total)}
+    return result_response(rows, format, headers)
+
+
+def _format_error(format: str, offset: int = 0, limit: int = None):
+    if format not in RESULT_FORMATS:
+        return {"error": f"Unknown format: {format} (expected one of {', '.join(RESULT_FORMATS)})"}
+    if offset < 0 or (limit is not None and limit < 0):
+        return {"error": "offset and limit must be >= 0"}
+    return None
+
+
+def _partition_error(partition_by: str, partition_baseline: str):
+    if partition_by is not None and partition_by not in PARTITION_KEYS:
+        return {"error": f"Unknown partition_by: {partition_by} (expected one of {', '.join(PARTITION_KEYS)})"}
+    if partition_baseline not in BASELINE_MODES:
+        return {"error": f"Unknown partition_baseline: {partition_baseline} "
+                         f"(expected one of {', '.join(BASELINE_MODES)})"}
+    return None
+
+
+@app.get("/scan")
+def get_scan_results(use_fake: bool = True, use_llm: bool = True, risks_only: bool = False, offset: int = 0,
+                     limit: int = None, format: str = "json"):
+    if not use_fake:
+        return {"error": "Use POST for real data"}
+    error = _format_error(format, offset, limit)
+    if error:
+        return error
+
+    try:
+        df, meta = scan_synthetic(use_llm), {}
+        store_scan(df, meta)
+        return rows_response(df, meta, risks_only, offset, limit, format)
     except Exception as e:
         print(f"Server Error: {e}")
         return {"error": str(e)}
 
 
 @app.post("/scan")
-async def scan_uploaded_csv(file: UploadFile = File(...), use_llm: bool = True):
-    content = await file.read()
+async def scan_uploaded_csv(file: UploadFile = File(...), use_llm: bool = True,
+                            baseline_id: str = None, segment_zscores: bool = False, out_of_core: bool = False,
+                            use_ledger_cache: bool = True, partition_by: str = None,
+                            partition_baseline: str = "shared", risks_only: bool = False, offset: int = 0,
+                            limit: int = None, format: str = "json"):
+    """
+    Scans an uploaded ledger. Pass `baseline_id` (from the X-Baseline-Id header
+    of an earlier full-history scan) to upload only the current month.
+    `segment_zscores` scores amounts against per-segment baselines.
+    `out_of_core` streams the file twice instead of loading it, and returns
+    only the flagged rows (for ledgers larger than RAM).
+    Re-scans of an identical export are served from the columnar ledger cache.
+    `partition_by` (entity, cost_center, gl_range or vendor) scores the
+    partitions in parallel processes, against one shared baseline or, with
+    `partition_baseline=partition`, each against its own history.
+    Response shape: `risks_only`, `offset`/`limit` (ordered by risk_score) and
+    `format` = json | ndjson | arrow | parquet (see rows_response).
+    For large files prefer POST /jobs/scan, which does not hold the connection.
+    """
+    error = _format_error(format, offset, limit) or _partition_error(partition_by, partition_baseline)
+    if error:
+        return error
+
+    detector = segment_model if segment_zscores else model
+    path, content_hash = await spool_upload(file)
     try:
-        df = pd.read_csv(io.BytesIO(content))
+        df, meta = await run_in_threadpool(
+            scan_spooled_upload, path, content_hash, detector, baseline_id=baseline_id, use_llm=use_llm,
+            out_of_core=out_of_core, use_ledger_cache=use_ledger_cache, partition_by=partition_by,
+            partition_baseline=partition_baseline,
+        )
+        await run_in_threadpool(store_scan, df, meta)
+        return await run_in_threadpool(rows_response, df, meta, risks_only, offset, limit, format)
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        os.remove(path)
 
-        # 1. Ingest
-        df = ingest_dataframe(df)
 
-        # 2. Detect
-        df = model.detect_anomalies(df)
+# --- Background scan jobs: submit, poll, fetch, cancel ---
+# Jobs keep only meta + rollup; the rows live in scan_sessions (under its
+# TTL and memory cap), referenced by meta["scan_id"].
+
+def _upload_scan_job(job, path, content_hash, detector, **options):
+    df, meta = scan_spooled_upload(path, content_hash, detector, job=job, **options)
+    rollup = store_scan(df, meta, job=job)
+    return {"meta": meta, "rollup": rollup}
+
+
+def _synthetic_scan_job(job, use_llm):
+    df, meta = scan_synthetic(use_llm, job=job), {}
+    rollup = store_scan(df, meta, job=job)
+    return {"meta": meta, "rollup": rollup}
+
+
+@app.post("/jobs/scan")
+async def submit_scan_job(file: UploadFile = File(None), use_fake: bool = False, use_llm: bool = True,
+                          baseline_id: str = None, segment_zscores: bool = False, out_of_core: bool = False,
+                          use_ledger_cache: bool = True, partition_by: str = None,
+                          partition_baseline: str = "shared"):
+    """
+    Queues a scan (same options as POST /scan, or `use_fake` with no file)
+    and returns its job id immediately. Poll GET /jobs/{job_id}.
+    """
+    error = _partition_error(partition_by, partition_baseline)
+    if error:
+        return error
+
+    if file is None:
+        if not use_fake:
+            return {"error": "Upload a CSV file or set use_fake=true"}
+        return job_queue.submit(_synthetic_scan_job, use_llm, kind="scan:synthetic").to_dict()
+
+    detector = segment_model if segment_zscores else model
+    path, content_hash = await spool_upload(file)
+    job = job_queue.submit(
+        _upload_scan_job, path, content_hash, detector,
+        baseline_id=baseline_id, use_llm=use_llm, out_of_core=out_of_core, use_ledger_cache=use_ledger_cache,
+        partition_by=partition_by, partition_baseline=partition_baseline,
+        kind="scan:upload", cleanup=lambda: os.remove(path),
+    )
+    return job.to_dict()
 
-        # 3. Explain
-        if use_llm:
-            df = explain_anomalies(df)
 
-        df = df.fillna("")
-        return df.to_dict(orient="records")
+def _scan_ledger(name: str, path: str, content_hash: str, detector: AnomalyModel, baseline: BaselineIndex,
+                 **options):
+    """
+    One ledger of a bulk scan, stored as its own scan session.
+    Returns (summary entry, risk rows tagged with the ledger name); a failed
+    ledger yields an entry with `error` and no rows instead of failing the job.
+    """
+    try:
+        df, meta = scan_spooled_upload(path, content_hash, detector, baseline=baseline, **options)
+        meta["ledger"] = name
+        rollup = store_scan(df, meta)
+    except Exception as e:
+        print(f"⚠️ Bulk scan: ledger {name} failed: {e}")
+        return {"ledger": name, "error": str(e)}, None
+
+    risks = df[df["status"] == "Risk"] if "status" in df.columns else df.iloc[0:0]
+    entry = {
+        **meta,
+        "rows": rollup["total_transactions"],
+        "anomalies": rollup["anomalies"],
+        "risk_value": rollup["risk_value"],
+        "error": None,
+    }
+    return entry, risks.assign(ledger=name)
+
+
+@profiler.profiled("scan:bulk")
+def _bulk_scan_job(job, ledgers: list, detector: AnomalyModel, baseline_id: str = None, **options):
+    """
+    Scans several ledgers concurrently (BULK_SCAN_WORKERS threads) against
+    the shared baseline store; a given `baseline_id` is loaded once for all.
+    The consolidated risk queue (every ledger's risks, highest score first)
+    becomes the job's scan session, so /jobs/{id}/result, /rollup and
+    POST /jobs/report work on it as on a single scan.
+    """
+    baseline = baseline_store.load(baseline_id) if baseline_id else None
+    entries, risk_frames = {}, []
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(BULK_SCAN_WORKERS, len(ledgers))),
+                              thread_name_prefix="bulk-scan")
+    try:
+        futures = {
+            pool.submit(_scan_ledger, name, path, content_hash, detector, baseline, **options): name
+            for name, path, content_hash in ledgers
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            entry, risks = future.result()
+            entries[futures[future]] = entry
+            if risks is not None and not risks.empty:
+                risk_frames.append(risks)
+            _report(job, f"ledgers {done}/{len(ledgers)}", 0.85 * done / len(ledgers))
+    finally:
+        # On cancellation (JobCancelled from _report) queued ledgers never start
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    queue = pd.concat(risk_frames, ignore_index=True) if risk_frames else pd.DataFrame()
+    if not queue.empty:
+        queue = queue[["ledger"] + [c for c in queue.columns if c != "ledger"]]
+        queue = queue.sort_values("risk_score", ascending=False, kind="stable").reset_index(drop=True)
+
+    scanned = [e for e in entries.values() if e["error"] is None]
+    meta = {"ledgers": len(ledgers), "failed": len(ledgers) - len(scanned),
+            "rows_scanned": sum(e["rows"] for e in scanned)}
+    rollup = store_scan(queue, meta, job=job)
+    return {"meta": meta, "rollup": rollup, "ledgers": [entries[name] for name, _, _ in ledgers]}
+
+
+@app.post("/jobs/scan/bulk")
+async def submit_bulk_scan_job(files: list[UploadFile] = File(...), use_llm: bool = True, baseline_id: str = None,
+                               segment_zscores: bool = False, out_of_core: bool = False,
+                               use_ledger_cache: bool = True):
+    """
+    Close-day scan of many ledgers in one job: several CSV files and / or
+    zips of CSVs (e.g. one export per subsidiary). Ledgers are scanned
+    concurrently with the options of POST /scan; `baseline_id` applies to
+    every ledger. Poll GET /jobs/{job_id}; GET /jobs/{job_id}/ledgers lists
+    each ledger's scan_id and totals, GET /jobs/{job_id}/result serves the
+    consolidated risk queue.
+    """
+    try:
+        if baseline_id and not baseline_store.exists(baseline_id):
+            return {"error": f"Unknown baseline: {baseline_id}"}
+        ledgers = await spool_bulk_uploads(files)
     except Exception as e:
         return {"error": str(e)}
 
+    if not ledgers:
+        return {"error": "No CSV ledgers in the upload"}
+    paths = [path for _, path, _ in ledgers]
 
-@app.post("/generate_report")
-async def generate_report(request: Request):
+    detector = segment_model if segment_zscores else model
+    job = job_queue.submit(
+        _bulk_scan_job, ledgers, detector, baseline_id=baseline_id, use_llm=use_llm, out_of_core=out_of_core,
+        use_ledger_cache=use_ledger_cache, kind="scan:bulk", cleanup=lambda: _remove_files(paths),
+    )
+    return {**job.to_dict(), "ledgers": [name for name, _, _ in ledgers]}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job: {job_id}"}
+    return job.to_dict()
+
+
+def _finished_job(job_id: str, kind: str):
+    """(job, None) for a done job of `kind` ("scan" / "report"), else (None, error dict)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return None, {"error": f"Unknown job: {job_id}"}
+    if job.status != "done":
+        return None, {**job.to_dict(), "error": job.error or f"Job is {job.status}"}
+    if not job.kind.startswith(kind):
+        return None, {"error": f"Job {job_id} is a {job.kind} job"}
+    return job, None
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, risks_only: bool = False, offset: int = 0, limit: int = None,
+                   format: str = "json"):
+    """Rows of a finished scan (read from its scan session); same response options as POST /scan."""
+    job, error = _finished_job(job_id, "scan")
+    if error:
+        return error
+    error = _format_error(format, offset, limit)
+    if error:
+        return error
+
+    scan_id = job.result["meta"]["scan_id"]
+    session = scan_sessions.get(scan_id)
+    if session is None:
+        return {"error": f"Result of job {job_id} expired (scan {scan_id}); re-run the scan"}
+    return rows_response(session.df, session.meta, risks_only, offset, limit, format)
+
+
+@app.get("/jobs/{job_id}/rollup")
+def get_job_rollup(job_id: str):
+    """Exposure rollup of a finished scan (headline metrics, segments, top risks)."""
+    job, error = _finished_job(job_id, "scan")
+    if error:
+        return error
+    return job.result["rollup"]
+
+
+@app.get("/jobs/{job_id}/ledgers")
+def get_bulk_job_ledgers(job_id: str):
+    """Per-ledger outcome of a bulk scan: scan_id (for /scans/{scan_id}/...), rows, anomalies, risk value, error."""
+    job, error = _finished_job(job_id, "scan:bulk")
+    if error:
+        return error
+    return job.result["ledgers"]
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    return {"job_id": job_id, "cancelled": job_queue.cancel(job_id)}
+
+
+# --- Scan sessions: results kept server-side, referenced by scan id ---
+
+@app.get("/scans")
+def get_scan_session_stats():
+    """Number and memory footprint of live scan sessions."""
+    return scan_sessions.snapshot()
+
+
+@app.get("/scans/{scan_id}")
+def get_scan_session(scan_id: str):
+    session = scan_sessions.get(scan_id)
+    if session is None:
+        return {"error": f"Unknown or expired scan: {scan_id}"}
+    return session.to_dict()
+
+
+@app.get("/scans/{scan_id}/rollup")
+def get_scan_rollup(scan_id: str):
+    """Exposure rollup of a stored scan (headline metrics, segments, top risks)."""
+    session = scan_sessions.get(scan_id)
+    if session is None:
+        return {"error": f"Unknown or expired scan: {scan_id}"}
+    return session.rollup
+
+
+@app.get("/scans/{scan_id}/rows")
+def get_scan_rows(scan_id: str, risks_only: bool = False, offset: int = 0, limit: int = None,
+                  format: str = "json"):
+    """Rows of a stored scan; same response options as POST /scan."""
+    session = scan_sessions.get(scan_id)
+    if session is None:
+        return {"error": f"Unknown or expired scan: {scan_id}"}
+    error = _format_error(format, offset, limit)
+    if error:
+        return error
+    return rows_response(session.df, session.meta, risks_only, offset, limit, format)
+
+
+@app.get("/scans/{scan_id}/risks")
+def get_scan_risks(scan_id: str):
+    """Flagged rows of a stored scan, highest risk first."""
+    return get_scan_rows(scan_id, risks_only=True)
+
+
+@app.delete("/scans/{scan_id}")
+def delete_scan_session(scan_id: str):
+    return {"scan_id": scan_id, "deleted": scan_sessions.delete(scan_id)}
+
+
+@app.post("/baseline/{baseline_id}/extend")
+async def extend_baseline(baseline_id: str, file: UploadFile = File(...), decay: float = None):
     """
-    Receives current full dataframe, generates summary + PDF.
+    Folds a newly closed month into a stored baseline (O(new rows)) and
+    returns the id of the extended snapshot.
     """
     try:
-        body = await request.json()
-        data = body.get("data", [])
+        new_rows = await load_ledger(file)
+        if decay is not None and not 0 < decay <= 1:
+            return {"error": "decay must be in (0, 1]"}
+
+        extended = baseline_store.load(baseline_id).extend(new_rows, decay=decay)
+        return {"baseline_id": baseline_store.save(extended), "months": extended.months}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/llm/cache")
+def get_explanation_cache_stats():
+    """Hit/miss counters of the LLM explanation cache (saved model calls)."""
+    return explanation_cache.snapshot()
+
+
+@app.get("/llm/models")
+def get_llm_model_health():
+    """Circuit state, failures and latency of each model in the fallback chain."""
+    return llm_router.snapshot()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text format: stage timings, rows, LLM latency / tokens / fallbacks, service gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-        if not data:
-            return {"error": "No data provided"}
 
+# --- Runtime profiling: arm cProfile for the next N scans / reports ---
+
+@app.post("/debug/profile")
+def arm_profiler(count: int = 1):
+    """Profiles the next `count` scans or report renders (0 disarms)."""
+    profiler.arm(count)
+    return {"armed": profiler.armed}
+
+
+@app.get("/debug/profiles")
+def list_profiles():
+    return {"armed": profiler.armed, "profiles": profiler.list()}
+
+
+@app.get("/debug/profiles/{name}")
+def get_profile(name: str, limit: int = 40, sort: str = "cumulative"):
+    """Top functions of a saved profile (pstats text)."""
+    try:
+        return PlainTextResponse(profiler.summary(name, limit=limit, sort=sort))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _report_input(body: dict):
+    """
+    (risk rows, rollup) for a report request: {"scan_id": ...} (the X-Scan-Id
+    header of the scan), or the full ledger as {"data": [...]} with an
+    optional `rollup`. Raises ValueError when neither is usable.
+    """
+    scan_id = body.get("scan_id")
+    if scan_id:
+        session = scan_sessions.get(scan_id)
+        if session is None:
+            raise ValueError(f"Unknown or expired scan: {scan_id}")
+        df, rollup = session.df, session.rollup
+    else:
+        data = body.get("data", [])
+        if not data:
+            raise ValueError("No data provided")
         df = pd.DataFrame(data)
+        rollup = body.get("rollup") or build_rollup(df)
+
+    return df[df["status"] == "Risk"], rollup
+
+
+@profiler.profiled("report")
+def render_report(risks_df: pd.DataFrame, rollup: dict, job=None):
+    """Summary + PDF bytes. Blocking: runs in a worker thread or as a background job."""
+    # 1. Generate LLM Summary (Only send risks to LLM)
+    _report(job, "summary", 0.1)
+    with stage("report:summary", rows=len(risks_df)):
+        summary = generate_batch_summary(risks_df, rollup=rollup)
 
-        # Calculate Metrics for PDF Header
-        total_tx = len(df)
-        risks_df = df[df["status"] == "Risk"]
-        total_risk_val = risks_df["amount"].sum() if not risks_df.empty else 0
+    # 2. Generate PDF (Pass metrics)
+    _report(job, "render", 0.5)
+    with stage("report:pdf", rows=len(risks_df)):
+        pdf_buffer = create_audit_pdf(risks_df, summary, rollup["total_transactions"], rollup["risk_value"])
+    return summary, pdf_buffer.getvalue()
 
-        # 1. Generate LLM Summary (Only send risks to LLM)
-        summary = generate_batch_summary(risks_df)
 
-        # 2. Generate PDF (Pass metrics)
-        pdf_buffer = create_audit_pdf(risks_df, summary, total_tx, total_risk_val)
+def _report_job(job, risks_df, rollup):
+    summary, pdf = render_report(risks_df, rollup, job=job)
+    return {"summary": summary, "pdf": pdf}
+
+
+@app.post("/generate_report")
+async def generate_report(request: Request):
+    """
+    Generates summary + PDF (base64 in the JSON body). Same input as
+    POST /jobs/report, which renders off the request path and serves the
+    PDF as a binary download; prefer it for large exception lists.
+    """
+    try:
+        risks_df, rollup = _report_input(await request.json())
+        summary, pdf = await run_in_threadpool(render_report, risks_df, rollup)
 
-        pdf_base64 = base64.b64encode(pdf_buffer.getvalue()).decode("utf-8")
+        pdf_base64 = base64.b64encode(pdf).decode("utf-8")
 
         return {
             "summary": summary,
@@ -112,6 +838,47 @@ async def generate_report(request: Request):
         return {"error": str(e)}
 
 
+@app.post("/jobs/report")
+async def submit_report_job(request: Request):
+    """
+    Queues summary + PDF rendering for {"scan_id": ...} and returns the job
+    id. Poll GET /jobs/{job_id}, then fetch GET /jobs/{job_id}/report and
+    GET /jobs/{job_id}/report.pdf.
+    """
+    try:
+        risks_df, rollup = _report_input(await request.json())
+    except Exception as e:
+        return {"error": str(e)}
+    return job_queue.submit(_report_job, risks_df, rollup, kind="report").to_dict()
+
+
+@app.get("/jobs/{job_id}/report")
+def get_report_job(job_id: str):
+    job, error = _finished_job(job_id, "report")
+    if error:
+        return error
+    return {
+        "summary": job.result["summary"],
+        "pdf_url": f"/jobs/{job_id}/report.pdf",
+        "pdf_bytes": len(job.result["pdf"]),
+    }
+
+
+@app.get("/jobs/{job_id}/report.pdf")
+def download_report_pdf(job_id: str):
+    """The rendered PDF as a streamed binary download (no base64)."""
+    job, error = _finished_job(job_id, "report")
+    if error:
+        return error
+    pdf = job.result["pdf"]
+    chunks = (pdf[i:i + UPLOAD_CHUNK_SIZE] for i in range(0, len(pdf), UPLOAD_CHUNK_SIZE))
+    return StreamingResponse(
+        chunks, media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="Audit_Exception_Report.pdf"',
+                 "Content-Length": str(len(pdf))},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,221 @@
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(".bsef_cache", "profiles"))
+
+# Seconds; covers a single LLM call up to a month-end scan
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRIC_HELP = {
+    "bsef_stage_seconds": "Wall time of a pipeline stage (ingest, detect, explain, report).",
+    "bsef_rows_processed_total": "Rows handled by a pipeline stage.",
+    "bsef_llm_request_seconds": "Latency of one model attempt, by model and outcome.",
+    "bsef_llm_tokens_total": "Tokens reported by the model, by model and kind (prompt / completion).",
+    "bsef_llm_fallbacks_total": "Calls answered by a model other than the first one tried.",
+    "bsef_llm_exhausted_total": "Calls for which every model in the chain failed.",
+    "bsef_explanations_total": "Risk explanations by tier (local template, cache, llm).",
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms rendered in the Prometheus text
+    format. Series are keyed by (name, sorted labels). `collectors` add
+    point-in-time gauges (cache sizes, circuit states) when scraped.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def register_collector(self, collect):
+        """`collect()` returns [(name, help, {labels}, value), ...] gauges, read at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines, seen = [], set()
+
+        def header(name, kind, text):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, {**v, "buckets": list(v["buckets"])}) for k, v in self._histograms.items())
+
+        for (name, labels), value in counters:
+            header(name, "counter", METRIC_HELP.get(name, name))
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), series in histograms:
+            header(name, "histogram", METRIC_HELP.get(name, name))
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(f"{name}_bucket{_labels(labels, {'le': bound})} {count}")
+            lines.append(f"{name}_bucket{_labels(labels, {'le': '+Inf'})} {series['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {series['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {series['count']}")
+
+        for collect in self._collectors:
+            try:
+                gauges = collect()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, text, labels, value in gauges:
+                header(name, "gauge", text)
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# Per-request {stage: seconds}; set by the timing middleware, filled by stage()
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    """
+    Times a pipeline stage into bsef_stage_seconds (and the request's timing
+    header, if any). Yields a dict; set span["rows"] when the row count is
+    only known at the end of the stage.
+    """
+    span = {"rows": rows}
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("bsef_stage_seconds", elapsed, stage=name)
+        if span["rows"] is not None:
+            metrics.inc("bsef_rows_processed_total", span["rows"], stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def server_timing(timings: dict) -> str:
+    """Server-Timing header value (durations in ms)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class Profiler:
+    """
+    Runtime-switchable cProfile hook. `arm(n)` profiles the next `n`
+    captured scans; each is written as a .prof file (pstats / snakeviz)
+    to `directory`.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self._remaining = 0
+        self._lock = threading.Lock()
+
+    def arm(self, count: int = 1):
+        with self._lock:
+            self._remaining = max(count, 0)
+
+    @property
+    def armed(self) -> int:
+        return self._remaining
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    @contextmanager
+    def capture(self, label: str):
+        if not self._remaining or not self._claim():
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process; give the slot back
+            with self._lock:
+                self._remaining += 1
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{label.replace(':', '-')}.prof"
+            profile.dump_stats(os.path.join(self.directory, name))
+            print(f"🧪 Profile saved: {name}")
+
+    def profiled(self, label: str):
+        """Decorator: calls of the function are captured while the profiler is armed."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.capture(label):
+                    return fn(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def list(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((f for f in os.listdir(self.directory) if f.endswith(".prof")), reverse=True)
+
+    def summary(self, name: str, limit: int = 40, sort: str = "cumulative") -> str:
+        """Top functions of a saved profile, as pstats text."""
+        if name not in self.list():
+            raise ValueError(f"Unknown profile: {name}")
+        out = io.StringIO()
+        pstats.Stats(os.path.join(self.directory, name), stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+profiler = Profiler()
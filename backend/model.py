@@ -1,10 +1,64 @@
 import pandas as pd
 import numpy as np
 
+from baseline import BaselineIndex
+from duplicates import EXACT_DUPLICATE, NEAR_DUPLICATE, DuplicatePaymentLayer, align_matches
+from isolation_forest import IsolationForestLayer
+from rules import Features, RuleSet, _append_reason, _round_like_python, default_rules
+
 
 class AnomalyModel:
 
-    def detect_anomalies(self, df: pd.DataFrame) -> pd.DataFrame:
+    def __init__(self, zscore_mode: str = "global", min_segment_count: int = 5,
+                 isolation_forest: IsolationForestLayer = None, ml_weight: float = 0.5, ml_floor: float = 0.45,
+                 duplicates: DuplicatePaymentLayer = None, rules: RuleSet = None):
+        """
+        zscore_mode: "global" scores every row against the all-history mean/std;
+        "segment" uses the row's vendor x GL x cost center baseline when that
+        segment has at least `min_segment_count` observations, else the global one.
+        isolation_forest: optional ML layer; its score is blended into risk_score
+        with weight `ml_weight`, and its outliers get at least `ml_floor`.
+        duplicates: optional duplicate-payment check over the rows of the scan.
+        rules: compiled rule set (default: rules.json, see rules.py).
+        """
+        if zscore_mode not in ("global", "segment"):
+            raise ValueError(f"Unknown zscore_mode: {zscore_mode}")
+        self.zscore_mode = zscore_mode
+        self.min_segment_count = min_segment_count
+        self.isolation_forest = isolation_forest
+        self.ml_weight = ml_weight
+        self.ml_floor = ml_floor
+        self.duplicates = duplicates
+        self.rules = rules if rules is not None else default_rules()
+
+    def build_baseline(self, df: pd.DataFrame):
+        """
+        Baseline from everything except the very last month.
+        Returns None when there is no usable history.
+        """
+        if "accounting_month" not in df.columns:
+            return None
+
+        months = sorted(df["accounting_month"].unique())
+        if len(months) < 2:
+            return None
+
+        historical = df[df["accounting_month"] != months[-1]]
+        if historical.empty:
+            return None
+
+        return BaselineIndex.from_history(historical)
+
+    def detect_anomalies(self, df: pd.DataFrame, baseline: BaselineIndex = None,
+                         current_month: str = None, duplicate_matches: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Scores the ledger. Without `baseline`, history is taken from the ledger
+        itself (all but the latest month). With a stored `baseline`, the upload
+        may contain only the current month. `current_month` overrides the
+        "latest month in df" rule (used when scoring a ledger chunk by chunk).
+        `duplicate_matches` (DuplicatePaymentLayer.matches() of the whole
+        ledger, by df's index) replaces the check on df when df is only a part.
+        """
         df = df.copy()
 
         # Initialize defaults
@@ -20,82 +74,141 @@ class AnomalyModel:
         else:
             return df
 
-        if len(months) < 2:
+        if not months:
             return df
 
-        # Define Baseline: Use everything except the very last month for training
-        latest_month = months[-1]
-        historical = df[df["accounting_month"] != latest_month]
+        latest_month = current_month if current_month is not None else months[-1]
 
-        if historical.empty:
-            return df
-
-        # Calculate Baseline Stats (Global Context)
-        global_mean = historical["amount"].mean()
-        global_std = historical["amount"].std()
-
-        # Get unique sets for O(1) lookup
-        historical_vendors = set(historical["vendor"].unique())
-        historical_gls = set(historical["gl_code"].unique())
-
-        # FIX 2: Iterate through ALL rows (df.iterrows), not just current.
-        # This ensures historical data also gets a score (likely low)
-        # so the table looks consistent.
-        for idx, row in df.iterrows():
-
-            # 1. CALCULATE Z-SCORE
-            z_score = abs(row["amount"] - global_mean) / (global_std + 1e-6)
-
-            # 2. CALCULATE BASE RISK SCORE
-            calculated_risk = min(z_score / 4, 1.0)
-
-            reasons = []
-
-            # --- RULE 1: STATISTICAL DEVIATION ---
-            if z_score > 3:
-                reasons.append(f"Extreme Spike ({round(z_score, 1)}x std dev)")
-                calculated_risk = max(calculated_risk, 0.85)
-            elif z_score > 2:
-                reasons.append(f"Unusual Variance ({round(z_score, 1)}x std dev)")
-                calculated_risk = max(calculated_risk, 0.5)
-            # FIX 1: Add catch for Medium risks (Gap between 1.6 and 2.0)
-            elif z_score > 1.5:
-                reasons.append(f"Moderate Deviation ({round(z_score, 1)}x std dev)")
-                calculated_risk = max(calculated_risk, 0.45)
-
-            # --- RULE 2: NEW ENTITY DETECTION ---
-            # Only apply "New Entity" logic to the LATEST month.
-            # (We don't want to flag Oct 2025 as 'New' just because it was the start of data)
-            if row["accounting_month"] == latest_month:
-                if row["vendor"] not in historical_vendors:
-                    reasons.append(f"New Vendor: {row['vendor']}")
-                    calculated_risk = max(calculated_risk, 0.6)
-
-                if row["gl_code"] not in historical_gls:
-                    reasons.append(f"New GL Code: {row['gl_code']}")
-                    calculated_risk = max(calculated_risk, 0.75)
-
-                # Check Unusual Transaction Type
-                vendor_history = historical[historical['vendor'] == row['vendor']]
-                if not vendor_history.empty:
-                    if row['transaction_type'] not in vendor_history['transaction_type'].values:
-                        reasons.append(f"Unusual Type '{row['transaction_type']}' for this vendor")
-                        calculated_risk = max(calculated_risk, 0.55)
-
-            # 3. ASSIGN FINAL VALUES
-            df.at[idx, "risk_score"] = round(calculated_risk, 3)
-
-            if calculated_risk > 0.7:
-                df.at[idx, "severity"] = "High"
-                df.at[idx, "status"] = "Risk"
-            elif calculated_risk > 0.4:
-                df.at[idx, "severity"] = "Medium"
-                df.at[idx, "status"] = "Risk"
-            else:
-                df.at[idx, "severity"] = "Low"
-                df.at[idx, "status"] = "OK"
-
-            if reasons:
-                df.at[idx, "anomaly_reason"] = "; ".join(reasons)
-
-        return df
\ No newline at end of file
+        # Define Baseline: Use everything except the very last month for training
+        if baseline is None:
+            baseline = self.build_baseline(df)
+            if baseline is None:
+                return df
+
+        # Score ALL rows (historical rows get a score too, likely low,
+        # so the table looks consistent). Every rule is a whole-column mask
+        # compiled from the rule config; nothing is evaluated row by row.
+        amounts = df["amount"].to_numpy(dtype=float)
+        is_current = (df["accounting_month"] == latest_month).to_numpy()
+        reasons = np.full(len(df), "", dtype=object)
+
+        # 1. CALCULATE Z-SCORE
+        ref_mean, ref_std = self._reference_stats(df, baseline)
+        z_score = np.abs(amounts - ref_mean) / (ref_std + 1e-6)
+
+        # 2. CALCULATE BASE RISK SCORE
+        calculated_risk = np.minimum(z_score / 4, 1.0)
+
+        # --- RULES: STATISTICAL DEVIATION + NEW ENTITY DETECTION (rules.json) ---
+        # Novelty features are computed only if some rule reads them.
+        self.rules.apply(self._features(df, baseline, is_current, z_score), calculated_risk, reasons)
+
+        # --- RULE 3: DUPLICATE PAYMENTS (current month, matched against any row) ---
+        dup = None
+        if self.duplicates is not None and is_current.any():
+            dup = (self.duplicates.matches(df) if duplicate_matches is None
+                   else align_matches(duplicate_matches, df.index))
+            self._apply_exact_duplicates(dup, is_current, calculated_risk, reasons)
+
+        # --- LAYER 2: ISOLATION FOREST (current month only) ---
+        if self.isolation_forest is not None and is_current.any():
+            self._apply_isolation_forest(df, baseline, is_current, calculated_risk, reasons)
+
+        # Near duplicates only back up the other signals, so they go last
+        if dup is not None:
+            self._note_near_duplicates(dup, is_current, calculated_risk, reasons)
+
+        # 3. ASSIGN FINAL VALUES
+        df["risk_score"] = _round_like_python(calculated_risk, 3)
+        df["severity"], df["status"] = self.rules.grade(calculated_risk)
+        df["anomaly_reason"] = np.where(reasons == "", "None", reasons)
+
+        return df
+
+    def _features(self, df: pd.DataFrame, baseline: BaselineIndex, is_current: np.ndarray,
+                  z_score: np.ndarray) -> Features:
+        """
+        Named columns rules can test besides the ledger's own: z_score,
+        is_current and the baseline novelty flags (listed in rules.FEATURES,
+        which rule files are checked against). "New Entity" flags only
+        make sense for the latest month, so rules pair them with is_current.
+        """
+
+        def new_vendor_type():
+            # The vendor has history, but never with this transaction type
+            if "transaction_type" not in df.columns:
+                return None
+            return ~baseline.known_vendor_type(df["vendor"], df["transaction_type"])
+
+        return Features(df, {
+            "z_score": lambda: z_score,
+            "is_current": lambda: is_current,
+            "new_vendor": lambda: ~baseline.known_vendor(df["vendor"]),
+            "new_gl_code": lambda: ~baseline.known_gl_code(df["gl_code"]),
+            "new_vendor_type": new_vendor_type,
+        })
+
+    def _reference_stats(self, df: pd.DataFrame, baseline: BaselineIndex):
+        """Mean/std each row's z-score is measured against (segment or global)."""
+        if self.zscore_mode != "segment" or baseline.segments is None:
+            return baseline.mean, baseline.std
+
+        count, seg_mean, seg_std = baseline.segments.lookup(df)
+        use_segment = (count >= self.min_segment_count) & (seg_std > 0)
+        ref_mean = np.where(use_segment, seg_mean, baseline.mean)
+        ref_std = np.where(use_segment, seg_std, baseline.std)
+        return ref_mean, ref_std
+
+    def reference_means(self, df: pd.DataFrame, baseline: BaselineIndex) -> pd.Series:
+        """Mean each row of `df` was scored against, by index (the "typical" amount in notes)."""
+        ref_mean, _ = self._reference_stats(df, baseline)
+        return pd.Series(np.broadcast_to(ref_mean, len(df)), index=df.index, dtype=float)
+
+    def _apply_isolation_forest(self, df, baseline, is_current, calculated_risk, reasons):
+        """Blends the forest's anomaly score into `calculated_risk` in place."""
+        # Only train on this frame when its non-current rows are exactly the
+        # baseline's history (same content digest, not just the same row
+        # count); otherwise the forest must already be cached under the fingerprint.
+        fitted = self.isolation_forest.get_model(baseline.fingerprint)
+        if fitted is None:
+            historical = df[~is_current]
+            if not baseline.describes(historical):
+                return
+            fitted = self.isolation_forest.get_model(baseline.fingerprint, historical)
+        if fitted is None:
+            return
+
+        anomaly_score, is_outlier = self.isolation_forest.score(fitted, df[is_current])
+
+        # 0 for typical points (s <= 0.5), rising to 1 for fully isolated ones.
+        # Noisy-OR blend: the ML layer can raise a rule-based risk, never lower it.
+        ml_risk = np.clip((anomaly_score - 0.5) * 2, 0, 1)
+        current_risk = calculated_risk[is_current]
+        blended = 1 - (1 - current_risk) * (1 - self.ml_weight * ml_risk)
+        blended[is_outlier] = np.maximum(blended[is_outlier], self.ml_floor)
+        calculated_risk[is_current] = blended
+
+        outlier = np.zeros(len(df), dtype=bool)
+        outlier[np.flatnonzero(is_current)[is_outlier]] = True
+        score_text = pd.Series(anomaly_score[is_outlier]).map("{:.2f}".format).to_numpy(dtype=object)
+        _append_reason(reasons, outlier, "Isolation Forest Outlier (score " + score_text + ")")
+
+    def _apply_exact_duplicates(self, dup, is_current, calculated_risk, reasons):
+        """Raises exact duplicates among the current rows to the layer's floor, in place."""
+        exact = is_current & (dup["dup_kind"].to_numpy() == EXACT_DUPLICATE)
+        match = dup["dup_match"].to_numpy(dtype=object)
+        _append_reason(reasons, exact, "Duplicate Payment: same vendor, amount and date as #" + match[exact])
+        calculated_risk[exact] = np.maximum(calculated_risk[exact], self.duplicates.exact_floor)
+
+    def _note_near_duplicates(self, dup, is_current, calculated_risk, reasons):
+        """Adds the near-duplicate reason to current rows already above the risk threshold (risk unchanged)."""
+        near = (is_current & (dup["dup_kind"].to_numpy() == NEAR_DUPLICATE)
+                & (calculated_risk > self.rules.risk_threshold))
+        if not near.any():
+            return
+        pct = dup["dup_diff"].to_numpy()[near] * 100
+        pct = pd.Series(pct).map("{:.1f}".format).to_numpy(dtype=object)
+        days = dup["dup_apart"].to_numpy()[near].astype(str).astype(object)
+        match = dup["dup_match"].to_numpy(dtype=object)[near]
+        _append_reason(reasons, near,
+                       "Possible Duplicate: within " + pct + "% of #" + match + ", " + days + " days apart")
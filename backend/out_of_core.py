@@ -0,0 +1,155 @@
+import os
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from baseline import BaselineIndex
+from data_ingestion import iter_ledger_csv, ingest_dataframe
+from duplicates import NO_MATCH
+from isolation_forest import CATEGORICAL_FEATURES
+from model import AnomalyModel
+
+DEFAULT_CHUNKSIZE = 250_000
+# History rows kept (uniformly sampled) to fit the isolation forest out of core
+FOREST_SAMPLE_ROWS = int(os.getenv("FOREST_SAMPLE_ROWS", "200000"))
+
+
+def _sample_month(sample, rows: pd.DataFrame, rng: np.random.Generator, size: int) -> pd.DataFrame:
+    """
+    Chunked reservoir sampling: every row gets a uniform random key and the
+    `size` smallest keys seen so far are kept, i.e. a uniform sample without
+    replacement however many chunks the month spans.
+    """
+    cols = [c for c in ["amount"] + CATEGORICAL_FEATURES if c in rows.columns]
+    rows = rows[cols].assign(_key=rng.random(len(rows)))
+    if sample is not None:
+        rows = pd.concat([sample, rows], ignore_index=True)
+    return rows.nsmallest(size, "_key") if len(rows) > size else rows
+
+
+def _fit_forest(model: AnomalyModel, baseline: BaselineIndex, month_samples: dict, history_months,
+                size: int):
+    """Fits (or loads) the forest for `baseline` from the sampled history months."""
+    sample = pd.concat([month_samples[m] for m in history_months], ignore_index=True)
+    sample = sample.nsmallest(size, "_key") if len(sample) > size else sample
+    model.isolation_forest.get_model(baseline.fingerprint, sample.drop(columns="_key"))
+
+
+def _concat_collected(frames: list) -> pd.DataFrame:
+    """Concatenates collected chunk columns; categoricals stay categorical (unioned categories)."""
+    columns = {}
+    for col in frames[0].columns:
+        parts = [f[col] for f in frames]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            columns[col] = union_categoricals(parts, ignore_order=True)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _current_matches(model: AnomalyModel, collected: list, current_month) -> pd.DataFrame:
+    """Duplicate matches over the whole ledger, kept for matched current-month rows (by row position)."""
+    if not collected:
+        return None
+    ledger = _concat_collected(collected)
+    found = model.duplicates.matches(ledger)
+    current = (ledger["accounting_month"].astype(str) == str(current_month)).to_numpy()
+    return found[current & (found["dup_kind"] != NO_MATCH).to_numpy()]
+
+
+def accumulate_baselines(path, chunksize: int = DEFAULT_CHUNKSIZE, on_chunk=None, month_samples: dict = None,
+                         sample_rows: int = FOREST_SAMPLE_ROWS, seed: int = 0, collect: list = None,
+                         collect_columns=()) -> dict:
+    """
+    Pass 1: streams the ledger once and returns {accounting_month: BaselineIndex}.
+    Only the per-month moments and entity sets are kept, never the rows; when
+    `month_samples` is given it is filled with up to `sample_rows` sampled
+    rows per month (the forest's training columns only). When `collect` is
+    given, each chunk's `collect_columns` (plus accounting_month) are
+    appended to it.
+    """
+    month_baselines = {}
+    rng = np.random.default_rng(seed)
+    offset = 0
+    for chunk in iter_ledger_csv(path, chunksize):
+        chunk = ingest_dataframe(chunk, id_offset=offset)
+        offset += len(chunk)
+        if "accounting_month" not in chunk.columns:
+            raise ValueError("Out-of-core scan needs an 'accounting_month' or 'date' column")
+        if collect is not None:
+            collect.append(chunk[[c for c in collect_columns if c in chunk.columns] + ["accounting_month"]])
+
+        for month, rows in chunk.groupby("accounting_month", sort=False, observed=True):
+            part = BaselineIndex.from_history(rows)
+            month_baselines[month] = month_baselines[month].merge(part) if month in month_baselines else part
+            if month_samples is not None:
+                month_samples[month] = _sample_month(month_samples.get(month), rows, rng, sample_rows)
+
+        if on_chunk is not None:
+            on_chunk(offset)
+
+    return month_baselines
+
+
+def scan_csv_out_of_core(path, output_path, model: AnomalyModel, chunksize: int = DEFAULT_CHUNKSIZE,
+                         baseline: BaselineIndex = None, on_chunk=None,
+                         forest_sample_rows: int = FOREST_SAMPLE_ROWS) -> dict:
+    """
+    Two-pass scan for ledgers that do not fit in memory.
+      Pass 1 accumulates the baseline (all months but the latest) and, when
+      the model has an isolation forest, a uniform sample of the history.
+      Pass 2 re-streams the file, scores each chunk against that baseline and
+      appends flagged rows to `output_path` (CSV) as it goes.
+    Rule-based scores match AnomalyModel.detect_anomalies on the whole ledger.
+    Differences from an in-memory scan:
+      - a forest not already cached for the baseline is fitted on at most
+        `forest_sample_rows` history rows (then cached under the baseline's
+        fingerprint), so its scores are close to, not identical with, a fit
+        on every row; with a stored `baseline` the forest must be cached
+    Duplicate payments are matched across the whole ledger: pass 1 also keeps
+    the few columns the check reads (id, vendor, amount, date, GL code) for
+    every row, so that much of the ledger does need to fit in memory.
+    `on_chunk(rows_done)` is called after every chunk of either pass.
+    """
+    month_samples = {} if model.isolation_forest is not None and baseline is None else None
+    collected = [] if model.duplicates is not None else None
+    month_baselines = accumulate_baselines(path, chunksize, on_chunk, month_samples, forest_sample_rows,
+                                           collect=collected,
+                                           collect_columns=model.duplicates.columns if collected is not None else ())
+    if not month_baselines:
+        return {"rows": 0, "flagged": 0, "current_month": None, "baseline": None}
+
+    months = sorted(month_baselines)
+    current_month = months[-1]
+    if baseline is None and len(months) > 1:
+        baseline = reduce(BaselineIndex.merge, (month_baselines[m] for m in months[:-1]))
+        if month_samples is not None:
+            _fit_forest(model, baseline, month_samples, months[:-1], forest_sample_rows)
+    matches = _current_matches(model, collected, current_month) if collected is not None else None
+    collected = None
+
+    rows = flagged = 0
+    offset = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as out:
+        for chunk in iter_ledger_csv(path, chunksize):
+            chunk = ingest_dataframe(chunk, id_offset=offset)
+            start, offset = offset, offset + len(chunk)
+            rows += len(chunk)
+            if baseline is not None:
+                chunk_matches = None
+                if matches is not None:
+                    chunk_matches = matches[(matches.index >= start) & (matches.index < offset)]
+                    chunk_matches = chunk_matches.set_axis(chunk.index[chunk_matches.index - start])
+                scored = model.detect_anomalies(chunk, baseline=baseline, current_month=current_month,
+                                                duplicate_matches=chunk_matches)
+                risks = scored[scored["status"] == "Risk"]
+                risks.to_csv(out, index=False, header=flagged == 0 and not risks.empty)
+                flagged += len(risks)
+            # (single month, no history: nothing can be flagged)
+
+            if on_chunk is not None:
+                on_chunk(offset)
+
+    return {"rows": rows, "flagged": flagged, "current_month": current_month, "baseline": baseline}
@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from baseline import FINGERPRINT_COLS, BaselineIndex
+from duplicates import MATCH_COLS
+from model import AnomalyModel
+from result_formats import arrow_bytes
+
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", "0")) or os.cpu_count() or 1
+# Below this size shipping the columns costs more than it saves
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "200000"))
+# "spawn" is safe next to the API's threads; "fork" starts faster
+PARALLEL_START_METHOD = os.getenv("PARALLEL_START_METHOD", "spawn")
+# Tasks per worker, so uneven partitions still keep every core busy
+TASKS_PER_WORKER = 4
+
+PARTITION_KEYS = ("entity", "cost_center", "gl_range", "vendor")
+BASELINE_MODES = ("shared", "partition")
+RESULT_COLS = ["status", "risk_score", "anomaly_reason", "severity"]
+
+# Long-lived pool: workers import pandas / sklearn once, not once per scan
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# Worker side: unpickled scan contexts by token (a scan sends several tasks per worker)
+_contexts = OrderedDict()
+_CONTEXT_SLOTS = 4
+
+
+def partition_labels(df: pd.DataFrame, partition_by: str, gl_range_size: int = 1000) -> pd.Series:
+    """Partition key of every row; "gl_range" buckets GL codes into blocks of `gl_range_size`."""
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"Unknown partition key: {partition_by} (expected one of {', '.join(PARTITION_KEYS)})")
+    if partition_by == "gl_range":
+        gl = pd.to_numeric(df["gl_code"].astype(str), errors="coerce")
+        return (gl // gl_range_size).fillna(-1).astype(int)
+    if partition_by not in df.columns:
+        raise ValueError(f"Cannot partition by '{partition_by}': the ledger has no {partition_by} column")
+    return df[partition_by].astype(str)
+
+
+def _plan_tasks(labels: pd.Series, n_tasks: int) -> list:
+    """Greedy largest-first packing of whole partitions into `n_tasks` row-position arrays."""
+    codes, _ = pd.factorize(labels, sort=False)
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    tasks = [[] for _ in range(max(1, min(n_tasks, len(counts))))]
+    loads = np.zeros(len(tasks), dtype=np.int64)
+    for code in np.argsort(-counts, kind="stable"):
+        target = int(np.argmin(loads))
+        tasks[target].append((code, order[bounds[code]:bounds[code + 1]]))
+        loads[target] += counts[code]
+    return [t for t in tasks if t]
+
+
+def _from_ipc(buffer: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(pa.py_buffer(buffer)).read_all().to_pandas()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            ctx = multiprocessing.get_context(PARALLEL_START_METHOD)
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers, mp_context=ctx), workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stops the worker processes (they are started again on the next parallel scan)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _worker_context(token: str, context: bytes):
+    if token not in _contexts:
+        detector, baseline, fallback, current_month = pickle.loads(context)
+        if detector.isolation_forest is not None:
+            # One process per core already; a forest using every core would oversubscribe
+            detector.isolation_forest.n_jobs = 1
+        _contexts[token] = (detector, baseline, fallback, current_month)
+        while len(_contexts) > _CONTEXT_SLOTS:
+            _contexts.popitem(last=False)
+    return _contexts[token]
+
+
+def _score_task(token: str, context: bytes, buffer: bytes, partition_sizes: list) -> bytes:
+    """
+    Worker: scores the partitions packed into one Arrow buffer (rows are
+    grouped by partition, sizes in order). Returns the result columns plus
+    each row's position in the original ledger, as Arrow IPC.
+    """
+    detector, baseline, fallback, current_month = _worker_context(token, context)
+    frame = _from_ipc(buffer)
+    # Duplicate matches come precomputed over the whole ledger
+    matches = frame[MATCH_COLS] if MATCH_COLS[0] in frame.columns else None
+
+    results, start = [], 0
+    for size in partition_sizes:
+        part = frame.iloc[start:start + size]
+        start += size
+        part_baseline = baseline
+        if part_baseline is None:
+            history = part[part["accounting_month"] != current_month]
+            # A partition with no history of its own (e.g. a new cost center)
+            # is scored against the whole ledger's baseline instead
+            part_baseline = BaselineIndex.from_history(history) if not history.empty else fallback
+        if part_baseline is None:
+            scored = part.assign(status="OK", risk_score=0.0, anomaly_reason="None", severity="Low")
+        else:
+            part_matches = matches.loc[part.index] if matches is not None else None
+            scored = detector.detect_anomalies(part, baseline=part_baseline, current_month=current_month,
+                                               duplicate_matches=part_matches)
+        results.append(scored[["_row"] + RESULT_COLS])
+
+    return arrow_bytes(pd.concat(results, ignore_index=True))
+
+
+def _prefit_forest(detector: AnomalyModel, df: pd.DataFrame, baseline: BaselineIndex, current_month):
+    """Fits (or loads) the baseline's forest here once; workers read it from the model cache."""
+    if detector.isolation_forest is None:
+        return
+    if detector.isolation_forest.get_model(baseline.fingerprint) is not None:
+        return
+    history = df[df["accounting_month"] != current_month]
+    if baseline.describes(history):
+        detector.isolation_forest.get_model(baseline.fingerprint, history)
+
+
+def scan_partitioned(df: pd.DataFrame, detector: AnomalyModel, partition_by: str = "cost_center",
+                     baseline: BaselineIndex = None, baseline_mode: str = "shared",
+                     workers: int = PARALLEL_WORKERS, gl_range_size: int = 1000,
+                     min_rows: int = PARALLEL_MIN_ROWS) -> pd.DataFrame:
+    """
+    detect_anomalies() spread over a process pool. Rows are partitioned by
+    `partition_by` (one of PARTITION_KEYS); each worker receives only the
+    scoring columns of its partitions as an Arrow buffer and returns the
+    four result columns the same way.
+    baseline_mode "shared" scores every partition against one baseline
+    (`baseline`, or all-but-the-latest month of `df`) and matches a serial
+    scan row for row; "partition" gives each partition a baseline built
+    from its own history, falling back to the shared one for partitions
+    without history. Small ledgers are scored serially.
+    Duplicate payments are matched once here over the whole ledger (an
+    O(n log n) sort), so pairs across partitions are still found.
+    """
+    if baseline_mode not in BASELINE_MODES:
+        raise ValueError(f"Unknown baseline_mode: {baseline_mode}")
+    if "accounting_month" not in df.columns or df.empty:
+        return detector.detect_anomalies(df, baseline=baseline)
+
+    labels = partition_labels(df, partition_by, gl_range_size)
+    current_month = sorted(df["accounting_month"].unique())[-1]
+    if baseline is None:
+        baseline = detector.build_baseline(df)
+    if baseline_mode == "shared":
+        if baseline is None:
+            return detector.detect_anomalies(df)
+        if workers <= 1 or len(df) < min_rows:
+            return detector.detect_anomalies(df, baseline=baseline)
+    if baseline is not None:
+        _prefit_forest(detector, df, baseline, current_month)
+
+    tasks = _plan_tasks(labels, max(workers, 1) * TASKS_PER_WORKER)
+    cols = [c for c in FINGERPRINT_COLS if c in df.columns]
+    columns = df[cols].reset_index(drop=True)
+    if detector.duplicates is not None:
+        matches = detector.duplicates.matches(df).reset_index(drop=True)
+        columns = pd.concat([columns, matches], axis=1)
+
+    shared, fallback = (baseline, None) if baseline_mode == "shared" else (None, baseline)
+    token = uuid.uuid4().hex
+    context = pickle.dumps((detector, shared, fallback, current_month))
+
+    pool = _get_pool(max(workers, 1))
+    try:
+        futures = []
+        for task in tasks:
+            positions = np.concatenate([rows for _, rows in task])
+            payload = columns.iloc[positions].assign(_row=positions)
+            futures.append(pool.submit(_score_task, token, context, arrow_bytes(payload),
+                                       [len(rows) for _, rows in task]))
+        parts = [_from_ipc(f.result()) for f in futures]
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time
+        shutdown_pool()
+        raise
+
+    merged = pd.concat(parts, ignore_index=True).sort_values("_row")
+    out = df.copy()
+    for col in RESULT_COLS:
+        out[col] = merged[col].to_numpy()
+    return out.sort_values("accounting_month", kind="stable")
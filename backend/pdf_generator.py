@@ -4,6 +4,68 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
 from datetime import datetime
+import os
+
+# Exception rows per table chunk (about one letter page); each chunk is laid
+# out on its own instead of one table spanning the whole list.
+PDF_TABLE_CHUNK_ROWS = int(os.getenv("PDF_TABLE_CHUNK_ROWS", "40"))
+
+EXCEPTION_HEADER = ['Severity', 'Vendor', 'GL Code', 'Amount', 'Risk Reason']
+
+# Shared by every chunk: header styling plus alternating row backgrounds
+# (ROWBACKGROUNDS), so no per-row commands are needed except for High rows.
+EXCEPTION_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C3E50")),  # Dark Blue Header
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
+])
+
+
+def _exception_rows(risks_df):
+    """Table rows for the risk list (reasons cleaned and truncated)."""
+    rows = []
+    for row in risks_df.to_dict(orient="records"):
+        # Truncate long reasons
+        reason = str(row.get('anomaly_reason', ''))
+        reason = reason.replace('🤖', '').replace('📝', '').strip()  # Clean emoji
+        if len(reason) > 60:
+            reason = reason[:57] + "..."
+
+        rows.append([
+            str(row.get('severity', 'Low')),
+            str(row.get('vendor', 'N/A')),
+            str(row.get('gl_code', 'N/A')),
+            f"${row.get('amount', 0):,.2f}",
+            reason
+        ])
+    return rows
+
+
+def _exception_tables(risks_df, chunk_rows=PDF_TABLE_CHUNK_ROWS):
+    """The exception list as page-sized tables sharing one style."""
+    rows = _exception_rows(risks_df)
+    tables = []
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        t = Table([EXCEPTION_HEADER] + chunk, colWidths=[50, 90, 50, 70, 200], repeatRows=1)
+        t.setStyle(EXCEPTION_TABLE_STYLE)
+
+        # Highlight High severity rows slightly
+        high = []
+        for i, row in enumerate(chunk, start=1):
+            if row[0] == "High":
+                high.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor("#FFF0F0")))  # Light Red tint
+                high.append(('TEXTCOLOR', (0, i), (0, i), colors.darkred))
+        if high:
+            t.setStyle(TableStyle(high))
+        tables.append(t)
+    return tables
 
 
 def create_audit_pdf(risks_df, summary_text, total_tx=0, total_risk_val=0):
@@ -78,60 +140,7 @@ def create_audit_pdf(risks_df, summary_text, total_tx=0, total_risk_val=0):
     story.append(Paragraph("High Priority Exceptions Detected", styles['Heading2']))
 
     if not risks_df.empty:
-        # Prepare Data for Table
-        # Headers
-        table_data = [['Severity', 'Vendor', 'GL Code', 'Amount', 'Risk Reason']]
-
-        # Sort by Risk (High first) just in case
-        # Note: We expect the DF passed to be filtered for risks already
-
-        for _, row in risks_df.iterrows():
-            # Truncate long reasons
-            reason = str(row.get('anomaly_reason', ''))
-            reason = reason.replace('🤖', '').strip()  # Clean emoji
-            if len(reason) > 60:
-                reason = reason[:57] + "..."
-
-            severity = row.get('severity', 'Low')
-
-            table_data.append([
-                severity,
-                row.get('vendor', 'N/A'),
-                str(row.get('gl_code', 'N/A')),
-                f"${row.get('amount', 0):,.2f}",
-                reason
-            ])
-
-        # Table Style
-        t = Table(table_data, colWidths=[50, 90, 50, 70, 200])
-
-        # Base Style
-        style_cmds = [
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2C3E50")),  # Dark Blue Header
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]
-
-        # Row coloring logic
-        for i, row in enumerate(table_data[1:]):  # Skip header
-            bg_color = colors.whitesmoke if i % 2 == 0 else colors.white
-            severity = row[0]
-
-            # Highlight High severity rows slightly
-            if severity == "High":
-                bg_color = colors.HexColor("#FFF0F0")  # Light Red tint
-
-            style_cmds.append(('BACKGROUND', (0, i + 1), (-1, i + 1), bg_color))
-            style_cmds.append(
-                ('TEXTCOLOR', (0, i + 1), (0, i + 1), colors.darkred if severity == "High" else colors.black))
-
-        t.setStyle(TableStyle(style_cmds))
-        story.append(t)
+        story.extend(_exception_tables(risks_df))
     else:
         story.append(Paragraph("No high priority risks found.", styles['Normal']))
 
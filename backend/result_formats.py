@@ -0,0 +1,71 @@
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from rollups import to_records
+
+RESULT_FORMATS = ("json", "ndjson", "arrow", "parquet")
+
+# Rows serialized per NDJSON chunk; only one batch is ever materialized as text
+NDJSON_BATCH_ROWS = int(os.getenv("NDJSON_BATCH_ROWS", "5000"))
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+def select_rows(df: pd.DataFrame, risks_only: bool = False, offset: int = 0, limit: int = None):
+    """
+    The slice of a scored ledger a client asked for. `risks_only` keeps the
+    flagged rows; any risk filter or page is ordered by risk_score (highest
+    first). Returns (rows, total rows before paging).
+    """
+    if risks_only and "status" in df.columns:
+        df = df[df["status"] == "Risk"]
+
+    paged = offset > 0 or limit is not None
+    if (risks_only or paged) and "risk_score" in df.columns:
+        df = df.sort_values("risk_score", ascending=False, kind="stable")
+
+    total = len(df)
+    if paged:
+        df = df.iloc[offset:offset + limit if limit is not None else None]
+    return df, total
+
+
+def ndjson_chunks(df: pd.DataFrame, batch_rows: int = NDJSON_BATCH_ROWS):
+    """One JSON object per line, encoded batch by batch."""
+    for start in range(0, len(df), batch_rows):
+        batch = df.iloc[start:start + batch_rows]
+        text = batch.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+        yield (text.rstrip("\n") + "\n").encode("utf-8")
+
+
+def arrow_bytes(df: pd.DataFrame) -> bytes:
+    """Arrow IPC stream; categoricals travel as dictionary columns."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    return buffer.getvalue()
+
+
+def result_response(df: pd.DataFrame, fmt: str = "json", headers: dict = None) -> Response:
+    """Serializes scan rows as a JSON list, streamed NDJSON, Arrow IPC or Parquet."""
+    if fmt == "ndjson":
+        return StreamingResponse(ndjson_chunks(df), media_type="application/x-ndjson", headers=headers)
+    if fmt == "arrow":
+        return Response(arrow_bytes(df), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    if fmt == "parquet":
+        return Response(parquet_bytes(df), media_type=PARQUET_MEDIA_TYPE, headers=headers)
+    return JSONResponse(jsonable_encoder(to_records(df)), headers=headers)
@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+
+ROLLUP_TOP_K = int(os.getenv("ROLLUP_TOP_K", "10"))
+
+# Exposure segments: every risk is totalled under vendor x GL x month x severity
+# (per ledger too, for the consolidated queue of a bulk scan)
+ROLLUP_KEYS = ["ledger", "vendor", "gl_code", "accounting_month", "severity"]
+
+# Fields kept per top exposure (enough for a prompt line or a table row)
+EXPOSURE_FIELDS = ["ledger", "id", "vendor", "gl_code", "accounting_month", "amount", "risk_score", "severity",
+                   "anomaly_reason"]
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """JSON-ready rows. Categoricals are decoded first so blanks can be filled."""
+    categorical = df.select_dtypes("category").columns
+    df = df.astype({col: object for col in categorical}).fillna("")
+    return df.to_dict(orient="records")
+
+
+def build_rollup(df: pd.DataFrame, total_rows: int = None, top_k: int = ROLLUP_TOP_K) -> dict:
+    """
+    One aggregation pass over a scored ledger: headline metrics, severity
+    totals, vendor x GL x month x severity exposure segments and the top-K
+    risks by score. The summary prompt, PDF and dashboard all read from it.
+    `total_rows` overrides len(df) when `df` holds only the flagged rows
+    (out-of-core scans).
+    """
+    total = len(df) if total_rows is None else total_rows
+    risks = df[df["status"] == "Risk"] if "status" in df.columns else df.iloc[0:0]
+    amounts = pd.to_numeric(risks["amount"], errors="coerce") if "amount" in risks.columns else pd.Series(dtype=float)
+
+    rollup = {
+        "total_transactions": int(total),
+        "anomalies": int(len(risks)),
+        "risk_value": round(float(amounts.sum()), 2),
+        "by_severity": {},
+        "segments": [],
+        "top_exposures": [],
+    }
+    if risks.empty:
+        return rollup
+
+    risks = risks.assign(amount=amounts)
+    severity = risks.groupby(risks["severity"].astype(str))["amount"].agg(["count", "sum"])
+    rollup["by_severity"] = {
+        level: {"count": int(row["count"]), "amount": round(float(row["sum"]), 2)}
+        for level, row in severity.iterrows()
+    }
+
+    keys = [k for k in ROLLUP_KEYS if k in risks.columns]
+    segments = (
+        risks.groupby(keys, observed=True, dropna=False)["amount"]
+        .agg(count="count", amount="sum")
+        .reset_index()
+        .sort_values("amount", ascending=False)
+    )
+    segments["amount"] = segments["amount"].round(2)
+    rollup["segments"] = to_records(segments)
+
+    fields = [f for f in EXPOSURE_FIELDS if f in risks.columns]
+    order = [c for c in ("risk_score", "amount") if c in risks.columns]
+    top = risks.sort_values(order, ascending=False).head(top_k)
+    rollup["top_exposures"] = to_records(top[fields])
+    return rollup
@@ -0,0 +1,245 @@
+import json
+import operator
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+DETECTION_RULES = os.getenv("DETECTION_RULES", DEFAULT_RULES_PATH)
+
+# "{field}" inserts a feature / column value, "{field|n}" the value rounded to n digits
+PLACEHOLDER = re.compile(r"\{(\w+)(?:\|(\d+))?\}")
+
+# Names a rule may use: the features AnomalyModel computes (model.py
+# _features) and the ingested ledger schema. Other ledger columns must be
+# declared under "columns" in the rule file.
+FEATURES = ("z_score", "is_current", "new_vendor", "new_gl_code", "new_vendor_type")
+LEDGER_COLUMNS = ("id", "date", "vendor", "gl_code", "amount", "accounting_month", "transaction_type",
+                  "cost_center", "entity")
+
+
+def _round_like_python(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    Column-wise round() that matches Python's built-in round() exactly.
+    np.round can disagree with round() on values sitting right on a tie,
+    so those (rare) cells are re-rounded with the builtin.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(v, ndigits) for v in values[near_tie]]
+    return rounded
+
+
+def _append_reason(reasons: np.ndarray, mask: np.ndarray, text: np.ndarray):
+    """Appends `text` (already filtered by `mask`) to the flagged rows, '; '-joined."""
+    if not mask.any():
+        return
+    current = reasons[mask]
+    sep = np.where(current == "", "", "; ").astype(object)
+    reasons[mask] = current + sep + text
+
+
+def _isin(values, options):
+    """Membership with the options coerced to the column's dtype (100, 100.0 and "100" all match 100)."""
+    values = pd.Series(values).infer_objects()
+    if pd.api.types.is_bool_dtype(values):
+        return values.isin([o for o in options if isinstance(o, bool)]).to_numpy()
+    if pd.api.types.is_numeric_dtype(values):
+        return values.isin(pd.to_numeric(pd.Series(options, dtype=object), errors="coerce").dropna()).to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.isin(pd.to_datetime(pd.Series(options, dtype=object), errors="coerce").dropna()).to_numpy()
+    return values.astype(str).isin([str(o) for o in options]).to_numpy()
+
+
+def _not_in(values, options):
+    return ~_isin(values, options)
+
+
+# Module-level callables, so compiled rules pickle (parallel scans ship the model to workers)
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": _isin,
+    "not_in": _not_in,
+}
+
+
+class Features:
+    """
+    Column view the rules are evaluated on: named features computed on first
+    use (then cached) from `providers`, falling back to ledger columns.
+    A provider may return None when the feature cannot be computed for this
+    ledger (e.g. no transaction_type column), as does an optional column the
+    ledger lacks; rules using it are skipped. Names are checked at load.
+    """
+
+    def __init__(self, df: pd.DataFrame, providers: dict):
+        self.df = df
+        self.providers = providers
+        self._values = {}
+
+    def get(self, name: str):
+        if name not in self._values:
+            if name in self.providers:
+                self._values[name] = self.providers[name]()
+            elif name in self.df.columns:
+                self._values[name] = self.df[name].to_numpy()
+            else:
+                self._values[name] = None
+        return self._values[name]
+
+
+class Rule:
+    """
+    One compiled rule: conditions (feature, operator, value) AND-ed into a
+    boolean mask, a risk floor and a reason template. Rules sharing a
+    `group` are exclusive: the first matching rule of the group wins.
+    """
+
+    def __init__(self, name: str, when: dict, floor: float, reason: str, group: str = None):
+        if not 0 <= floor <= 1:
+            raise ValueError(f"Rule {name}: floor must be in [0, 1]")
+        if not when:
+            raise ValueError(f"Rule {name}: needs at least one condition")
+        self.name = name
+        self.group = group
+        self.floor = float(floor)
+        self.reason = reason
+
+        self.conditions = []
+        for feature, test in when.items():
+            # `"new_vendor": true` is shorthand for {"==": true}
+            for op, value in (test.items() if isinstance(test, dict) else [("==", test)]):
+                if op not in OPERATORS:
+                    raise ValueError(f"Rule {name}: unknown operator {op!r} (expected one of {', '.join(OPERATORS)})")
+                if op in ("in", "not_in") and not isinstance(value, list):
+                    raise ValueError(f"Rule {name}: {op!r} needs a list of values")
+                self.conditions.append((feature, OPERATORS[op], value))
+
+        # Template split once into literal text and (field, digits) placeholders
+        self.parts, last = [], 0
+        for m in PLACEHOLDER.finditer(reason):
+            self.parts.append(reason[last:m.start()])
+            self.parts.append((m.group(1), int(m.group(2)) if m.group(2) else None))
+            last = m.end()
+        self.parts.append(reason[last:])
+
+    @property
+    def fields(self) -> set:
+        """Every feature / column the rule reads, in conditions or the reason template."""
+        return {feature for feature, _, _ in self.conditions} | {p[0] for p in self.parts if isinstance(p, tuple)}
+
+    def mask(self, features: Features):
+        """Rows matching every condition, or None when a feature is unavailable."""
+        result = None
+        for feature, op, value in self.conditions:
+            column = features.get(feature)
+            if column is None:
+                return None
+            hit = np.asarray(op(column, value), dtype=bool)
+            result = hit if result is None else result & hit
+        return result
+
+    def render(self, features: Features, mask: np.ndarray) -> np.ndarray:
+        """Reason text for the masked rows (object array)."""
+        text = np.full(int(mask.sum()), "", dtype=object)
+        for part in self.parts:
+            if isinstance(part, str):
+                text = text + part
+                continue
+            field, digits = part
+            values = features.get(field)[mask]
+            if digits is not None:
+                values = _round_like_python(values.astype(float), digits)
+            text = text + pd.Series(values).astype(str).to_numpy(dtype=object)
+        return text
+
+
+class RuleSet:
+    """
+    Declarative detection rules (rules.json, or the file named by
+    DETECTION_RULES; .yaml / .yml needs PyYAML). Compiled once; a scan
+    evaluates each rule as one vectorized mask and keeps the highest floor
+    per row (max-risk), so adding a rule adds one O(n) pass.
+    """
+
+    def __init__(self, rules: list, risk_threshold: float = 0.4, severity: list = None, columns=()):
+        self.rules = rules
+        # Extra ledger columns rules may read besides LEDGER_COLUMNS
+        self.columns = tuple(columns)
+        self.risk_threshold = risk_threshold
+        # [(level, lower bound)], highest first; anything below is "Low"
+        self.severity = sorted(severity or [("High", 0.7), ("Medium", 0.4)], key=lambda s: -s[1])
+        names = [r.name for r in rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Rule names must be unique")
+        # A misspelt name would otherwise only make the rule silently never match
+        known = set(FEATURES) | set(LEDGER_COLUMNS) | set(self.columns)
+        for rule in rules:
+            unknown = rule.fields - known
+            if unknown:
+                raise ValueError(f"Rule {rule.name}: unknown feature / column {', '.join(sorted(unknown))} "
+                                 f"(features: {', '.join(FEATURES)}; declare other ledger columns under \"columns\")")
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "RuleSet":
+        rules = [
+            Rule(r["name"], r["when"], r["floor"], r.get("reason", r["name"]), group=r.get("group"))
+            for r in config.get("rules", [])
+        ]
+        severity = [(s["level"], float(s["above"])) for s in config.get("severity", [])] or None
+        return cls(rules, risk_threshold=float(config.get("risk_threshold", 0.4)), severity=severity,
+                   columns=config.get("columns", ()))
+
+    @classmethod
+    def load(cls, path: str = DETECTION_RULES) -> "RuleSet":
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ValueError(f"{path}: YAML rule files need PyYAML (pip install pyyaml); or use JSON")
+                return cls.from_dict(yaml.safe_load(f))
+            return cls.from_dict(json.load(f))
+
+    def apply(self, features: Features, calculated_risk: np.ndarray, reasons: np.ndarray):
+        """Raises `calculated_risk` to each matching rule's floor and appends its reason, in place."""
+        unassigned = {}
+        for rule in self.rules:
+            mask = rule.mask(features)
+            if mask is None:
+                continue
+            if rule.group is not None:
+                free = unassigned.setdefault(rule.group, np.ones(len(calculated_risk), dtype=bool))
+                mask &= free
+                free &= ~mask
+            if not mask.any():
+                continue
+            _append_reason(reasons, mask, rule.render(features, mask))
+            calculated_risk[mask] = np.maximum(calculated_risk[mask], rule.floor)
+
+    def grade(self, calculated_risk: np.ndarray):
+        """(severity, status) columns for the final risk scores."""
+        severity = np.select([calculated_risk > bound for _, bound in self.severity],
+                             [level for level, _ in self.severity], default="Low")
+        status = np.where(calculated_risk > self.risk_threshold, "Risk", "OK")
+        return severity, status
+
+
+_default_rules = None
+
+
+def default_rules() -> RuleSet:
+    """The DETECTION_RULES rule set, loaded and compiled once per process."""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = RuleSet.load()
+    return _default_rules
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+SCAN_SESSION_TTL_S = float(os.getenv("SCAN_SESSION_TTL_S", "3600"))
+SCAN_SESSION_MAX_MB = float(os.getenv("SCAN_SESSION_MAX_MB", "512"))
+
+
+class ScanSession:
+    """One scored ledger kept server-side, plus its rollup and scan metadata."""
+
+    def __init__(self, df: pd.DataFrame, rollup: dict, meta: dict):
+        self.id = uuid.uuid4().hex
+        self.df = df
+        self.rollup = rollup
+        self.meta = meta
+        self.size_bytes = int(df.memory_usage(deep=True).sum())
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    def to_dict(self) -> dict:
+        return {
+            "scan_id": self.id,
+            "rows": len(self.df),
+            "size_mb": round(self.size_bytes / 1024 ** 2, 3),
+            "age_s": round(time.time() - self.created_at, 3),
+            **{k: v for k, v in self.meta.items() if k != "scan_id"},
+        }
+
+
+class ScanSessionStore:
+    """
+    In-process store of scan results keyed by scan id, so reports and later
+    queries reference a scan instead of posting the ledger back. Sessions
+    expire `ttl_s` after last use; past `max_mb` the least recently used
+    ones are evicted (the newest session is always kept).
+    """
+
+    def __init__(self, ttl_s: float = SCAN_SESSION_TTL_S, max_mb: float = SCAN_SESSION_MAX_MB):
+        self.ttl_s = ttl_s
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, df: pd.DataFrame, rollup: dict, meta: dict = None) -> str:
+        """Stores a scan result and returns its scan id."""
+        session = ScanSession(df, rollup, dict(meta or {}))
+        session.meta["scan_id"] = session.id
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict()
+        return session.id
+
+    def get(self, scan_id: str):
+        """Live session for `scan_id` (refreshing its TTL), or None if unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(scan_id)
+            if session is None:
+                return None
+            if time.time() - session.last_used > self.ttl_s:
+                del self._sessions[scan_id]
+                return None
+            session.last_used = time.time()
+            self._sessions.move_to_end(scan_id)
+            return session
+
+    def delete(self, scan_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(scan_id, None) is not None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._evict()
+            used = sum(s.size_bytes for s in self._sessions.values())
+            return {
+                "sessions": len(self._sessions),
+                "size_mb": round(used / 1024 ** 2, 3),
+                "max_mb": round(self.max_bytes / 1024 ** 2, 3),
+                "ttl_s": self.ttl_s,
+            }
+
+    def _evict(self):
+        now = time.time()
+        for scan_id in [k for k, s in self._sessions.items() if now - s.last_used > self.ttl_s]:
+            del self._sessions[scan_id]
+
+        used = sum(s.size_bytes for s in self._sessions.values())
+        while used > self.max_bytes and len(self._sessions) > 1:
+            _, oldest = self._sessions.popitem(last=False)
+            used -= oldest.size_bytes
@@ -0,0 +1,72 @@
+"""
+DuplicatePaymentLayer.find against a brute-force pairwise check.
+Run: python -m pytest -q (from the repo root or backend/)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from duplicates import EXACT_DUPLICATE, NEAR_DUPLICATE, NO_MATCH, DuplicatePaymentLayer
+
+
+def random_payments(seed: int) -> pd.DataFrame:
+    """Few vendors / GL codes, a short date range and clustered amounts, so matches are common."""
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 80))
+    base = rng.choice([100.0, 250.0, 999.99, 1000.0, -500.0], n)
+    amount = np.round(base * (1 + rng.normal(0, 0.004, n)), 2)
+    repeat = rng.random(n) < 0.2
+    amount[repeat] = rng.choice(amount, int(repeat.sum()))
+    return pd.DataFrame({
+        "id": rng.permutation(np.arange(1, n + 1)),
+        "vendor": rng.choice(["A", "B", "C"], n),
+        "gl_code": rng.choice([5001, 6001], n),
+        "amount": amount,
+        "date": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 20, n), unit="D"),
+    })
+
+
+def brute_force_kinds(df: pd.DataFrame, layer: DuplicatePaymentLayer) -> np.ndarray:
+    rows = df.to_dict(orient="records")
+    kinds = np.full(len(rows), NO_MATCH)
+    for i, r in enumerate(rows):
+        for e in rows:
+            if (e["date"], e["id"]) >= (r["date"], r["id"]) or e["vendor"] != r["vendor"]:
+                continue
+            if e["amount"] == r["amount"] and e["date"] == r["date"]:
+                kinds[i] = EXACT_DUPLICATE
+                break
+            rel = abs(r["amount"] - e["amount"]) / max(abs(r["amount"]), abs(e["amount"]))
+            if (e["gl_code"] == r["gl_code"] and r["amount"] != 0 and rel <= layer.amount_tolerance
+                    and (r["date"] - e["date"]).days <= layer.window_days):
+                kinds[i] = NEAR_DUPLICATE
+    return kinds
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_find_matches_brute_force(seed):
+    df = random_payments(seed)
+    layer = DuplicatePaymentLayer()
+    kind, match, diff, apart = layer.find(df)
+    assert kind.tolist() == brute_force_kinds(df, layer).tolist()
+
+    # Every reported match is an earlier row that really qualifies
+    for row in np.flatnonzero(kind != NO_MATCH):
+        r, e = df.iloc[row], df.iloc[match[row]]
+        assert (e["date"], e["id"]) < (r["date"], r["id"])
+        assert (r["date"] - e["date"]).days == apart[row]
+
+
+def test_same_day_tie_flags_the_later_id():
+    df = pd.DataFrame({
+        "id": [7, 3],
+        "vendor": ["A", "A"],
+        "gl_code": [5001, 5001],
+        "amount": [100.0, 100.0],
+        "date": pd.to_datetime(["2025-01-05", "2025-01-05"]),
+    })
+    for frame in (df, df.iloc[::-1]):
+        kind, match, _, _ = DuplicatePaymentLayer().find(frame)
+        flagged = frame["id"].to_numpy()[kind == EXACT_DUPLICATE]
+        assert flagged.tolist() == [7]
+        assert frame["id"].to_numpy()[match[kind == EXACT_DUPLICATE]].tolist() == [3]
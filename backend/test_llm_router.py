@@ -0,0 +1,127 @@
+"""
+ModelRouter with a fake model client and a fake clock (no network).
+Run: python -m pytest -q (from the repo root or backend/)
+"""
+import threading
+import time
+
+from llm_router import ModelRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    """call_model stand-in: per-model failure switch, optional latency and a gate to hold calls open."""
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.down = set()
+        self.gate = None
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str):
+        with self._lock:
+            self.calls.append(name)
+        if self.gate is not None:
+            self.gate.wait()
+        time.sleep(self.latency_s)
+        if name in self.down:
+            raise RuntimeError(f"{name} is down")
+        return f"{name}-ok"
+
+
+def run_concurrently(fn, n: int) -> list:
+    results = [None] * n
+
+    def worker(i):
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_circuit_opens_and_skips_the_failing_model():
+    clock, client = FakeClock(), FakeClient()
+    router = ModelRouter(["a", "b"], failure_threshold=2, cooldown_s=10, clock=clock)
+    client.down.add("a")
+
+    # A model with recent failures is tried after healthy ones, so make "a" fail twice on its own
+    client.down.add("b")
+    for _ in range(2):
+        assert router.call(client) == (None, None)
+    client.down.discard("b")
+    assert router.health["a"].state == "open"
+    assert router.health["b"].state == "open"
+    clock.now = 20  # both half-open: "b" recovers on its probe, "a" fails its probe and re-opens
+    assert router.call(client) == ("b", "b-ok")
+
+    client.calls.clear()
+    assert router.call(client) == ("b", "b-ok")
+    assert client.calls == ["b"]
+
+
+def test_half_open_model_gets_a_single_probe():
+    clock, client = FakeClock(), FakeClient()
+    router = ModelRouter(["a", "b"], failure_threshold=1, cooldown_s=10, clock=clock)
+    client.down.add("a")
+    router.call(client)
+    assert router.health["a"].state == "open"
+
+    # After the cooldown: "b" is down too, so every caller would fall through to "a"
+    clock.now = 20
+    client.down = {"b"}
+    client.gate = threading.Event()
+    client.calls.clear()
+    threading.Timer(0.3, client.gate.set).start()
+    results = run_concurrently(lambda: router.call(client), 5)
+
+    assert client.calls.count("a") == 1
+    assert results.count(("a", "a-ok")) == 1
+    assert router.health["a"].state == "closed"
+    assert not router.health["a"].probing
+
+
+def test_unused_probe_is_released():
+    clock, client = FakeClock(), FakeClient()
+    router = ModelRouter(["a", "b"], failure_threshold=1, cooldown_s=10, clock=clock)
+    client.down.add("a")
+    router.call(client)
+    assert router.health["a"].state == "open"
+
+    # "a" is half-open but "b" answers first, so the probe claim must be handed back
+    clock.now = 20
+    client.down.clear()
+    client.calls.clear()
+    assert router.call(client) == ("b", "b-ok")
+    assert client.calls == ["b"]
+    assert router.health["a"].state == "half_open" and not router.health["a"].probing
+
+
+def test_time_queued_for_a_slot_does_not_count_as_timeout():
+    # 12 callers, 4 attempt slots: the last wave starts ~0.4s in, after the first ones are done
+    client = FakeClient(latency_s=0.2)
+    router = ModelRouter(["a"], failure_threshold=1, timeout_s=0.5, max_workers=4)
+    results = run_concurrently(lambda: router.call(client), 12)
+
+    assert results == [("a", "a-ok")] * 12
+    assert router.health["a"].timeouts == 0
+    assert router.health["a"].state == "closed"
+
+
+def test_timeout_counts_and_opens_the_circuit():
+    client = FakeClient(latency_s=0.3)
+    router = ModelRouter(["a"], failure_threshold=1, timeout_s=0.1)
+    assert router.call(client) == (None, None)
+    assert router.health["a"].timeouts == 1
+    assert router.health["a"].state == "open"
@@ -0,0 +1,57 @@
+"""
+Rule set loading checks and condition operators.
+Run: python -m pytest -q (from the repo root or backend/)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from rules import Features, RuleSet, default_rules
+
+
+def rule(when, reason="flagged"):
+    return {"name": "r", "when": when, "floor": 0.5, "reason": reason}
+
+
+def test_default_rules_load():
+    assert [r.name for r in default_rules().rules][:3] == ["extreme_spike", "unusual_variance", "moderate_deviation"]
+
+
+@pytest.mark.parametrize("config", [
+    {"rules": [rule({"z_scor": {">": 3}})]},
+    {"rules": [rule({"amount": {">": 3}}, reason="Big ({amuont})")]},
+    {"rules": [rule({"approver": {"in": ["bob"]}})]},
+])
+def test_unknown_names_are_rejected_at_load(config):
+    with pytest.raises(ValueError, match="unknown feature / column"):
+        RuleSet.from_dict(config)
+
+
+def test_declared_column_is_accepted():
+    rules = RuleSet.from_dict({"columns": ["approver"], "rules": [rule({"approver": {"in": ["bob"]}})]})
+    df = pd.DataFrame({"approver": ["bob", "amy"]})
+    assert rules.rules[0].mask(Features(df, {})).tolist() == [True, False]
+
+
+@pytest.mark.parametrize("column, options, expected", [
+    (pd.Series([100, 200, 5001]), ["100.0", 5001], [True, False, True]),
+    (pd.Series([100.0, 200.5]), [100, "200.5"], [True, True]),
+    (pd.Series([5001, 6001]).astype("category"), ["5001"], [True, False]),
+    (pd.Series(["Journal", "Invoice"]).astype("category"), ["Journal"], [True, False]),
+    (pd.Series(["100", "100.0"]), [100], [True, False]),
+    (pd.to_datetime(pd.Series(["2025-01-05", "2025-01-06"])), ["2025-01-05"], [True, False]),
+])
+def test_in_coerces_options_to_the_column_dtype(column, options, expected):
+    rules = RuleSet.from_dict({"rules": [rule({"gl_code": {"in": options}})]})
+    features = Features(pd.DataFrame({"gl_code": column}), {})
+    assert rules.rules[0].mask(features).tolist() == expected
+
+    rules = RuleSet.from_dict({"rules": [rule({"gl_code": {"not_in": options}})]})
+    assert rules.rules[0].mask(features).tolist() == [not e for e in expected]
+
+
+def test_missing_optional_column_skips_the_rule():
+    rules = RuleSet.from_dict({"rules": [rule({"transaction_type": {"in": ["Journal"]}})]})
+    risk, reasons = np.zeros(2), np.full(2, "", dtype=object)
+    rules.apply(Features(pd.DataFrame({"amount": [1.0, 2.0]}), {}), risk, reasons)
+    assert risk.tolist() == [0.0, 0.0]